@@ -3,6 +3,7 @@
 For puzzle text, see: https://adventofcode.com/2021/day/3
 """
 
+import bisect
 from typing import Callable, List
 
 import numpy as np
@@ -81,61 +82,68 @@ def solve_part1(*, input_mode: str):
 
 # -- Part 2 -------------------------------------------------------------------
 
-def filter_by_bit_criteria(
-    candidates: list, bit_pos: int, op: Callable
-) -> list:
-    """Filter the candidates list by the bit criteria for a certain position"""
-    n1 = sum([c[bit_pos] == "1" for c in candidates])
-    n0 = len(candidates) - n1
-    keep_bit = "1" if op(n0, n1) else "0"
-    print(
-        f"{len(candidates):4d} candidates, bit position {bit_pos:2d}:  "
-        f"{n0:3d} x0, {n1:3d} x1  =>  keep {keep_bit}"
-    )
-
-    filtered = [c for c in candidates if c[bit_pos] == keep_bit]
-    return filtered
-
+def bisect_by_bit_criteria(
+    values: List[int], *, n_bits: int, op: Callable
+) -> int:
+    """Determines a rating from the *sorted* list of report values by applying
+    the bit criteria via binary search.
 
-def apply_filter(candidates: list, op: Callable) -> bin:
-    """Applies the filter to the list of candidate bit patterns
+    As the values are sorted, all candidates that remain after filtering by
+    the leading bits form a contiguous range ``[lo, hi)`` of the list. Within
+    that range, those with a 0 in the current bit position come first, such
+    that the split point can be found by bisection. Each rating thus costs
+    O(w log n) after sorting, with ``w`` being the number of bits.
 
     Args:
-        candidates (list): List of binary number strings
-        op (Callable): The binary comparison operator to determine by
-            which bit to filter, i.e. the candidate bit patterns with which
-            bit in the currently selected bit position to keep.
-            The operator is called with arguments (# bit 0, # bit 1) and the
-            return value (true or false) determines which bit patterns (with a
-            1 or 0 in the position) will be kept.
+        values (List[int]): The report values, sorted in ascending order
+        n_bits (int): The number of bits of each value
+        op (Callable): The binary comparison operator determining which bit
+            to keep. It is called with arguments (# bit 0, # bit 1) and if
+            the return value is true, candidates with a 1 bit are kept.
     """
-    col = 0
-    while len(candidates) > 1:
-        candidates = filter_by_bit_criteria(candidates, bit_pos=col, op=op)
-        col += 1
+    lo, hi = 0, len(values)
+    prefix = 0
+
+    for bit_pos in range(n_bits - 1, -1, -1):
+        if hi - lo <= 1:
+            break
+
+        # All candidates share the prefix, so the first one with a 1 bit in
+        # the current position is at the insertion point of prefix | bit
+        mid = bisect.bisect_left(values, prefix | (1 << bit_pos), lo, hi)
+        n0, n1 = mid - lo, hi - mid
 
-    else:
-        print("Gotcha!\n")
-        return candidates[0]
+        if op(n0, n1):
+            lo = mid
+            prefix |= 1 << bit_pos
+        else:
+            hi = mid
+
+    if hi - lo != 1:
+        raise ValueError(
+            "Bit criteria did not narrow down to a single value; "
+            f"{hi - lo} candidates remain!"
+        )
+    return values[lo]
 
 
 def solve_part2(*, input_mode: str):
     """Computes the solution for part 2"""
     data = load_input(input_mode, **INPUT_KWARGS)
-    print(f"Data has {len(data)} lines with {len(data[0])} columns.\n")
+    n_bits = len(data[0])
+    print(f"Data has {len(data)} lines with {n_bits} columns.\n")
 
-    o2gen_bin = apply_filter(
-        [d for d in data], op=lambda n0, n1: n0 <= n1,
+    # Sort once; each rating is then found by bisecting within the sorted list
+    values = sorted(int(d, 2) for d in data)
+
+    o2gen_dec = bisect_by_bit_criteria(
+        values, n_bits=n_bits, op=lambda n0, n1: n0 <= n1,
     )
-    co2scrub_bin = apply_filter(
-        [d for d in data], op=lambda n0, n1: n0 > n1,
+    co2scrub_dec = bisect_by_bit_criteria(
+        values, n_bits=n_bits, op=lambda n0, n1: n0 > n1,
     )
 
-    o2gen_dec = int(o2gen_bin, 2)
-    co2scrub_dec = int(co2scrub_bin, 2)
-
-    print(f"O2 generator:  {o2gen_bin}  -->  {o2gen_dec}")
-    print(f"CO2 scrubber:  {co2scrub_bin}  -->  {co2scrub_dec}")
+    print(f"O2 generator:  {o2gen_dec:0{n_bits}b}  -->  {o2gen_dec}")
+    print(f"CO2 scrubber:  {co2scrub_dec:0{n_bits}b}  -->  {co2scrub_dec}")
 
     return o2gen_dec * co2scrub_dec
-    
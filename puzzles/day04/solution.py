@@ -2,7 +2,6 @@
 
 For puzzle text, see: https://adventofcode.com/2021/day/4
 """
-import copy
 from typing import Tuple, List
 
 import numpy as np
@@ -35,9 +34,6 @@ TEST_INPUT = """
 
 INPUT_KWARGS = dict(day=DAY, fpath=INPUT_FILE, test_input=TEST_INPUT)
 
-BOARD_SIZE = 5
-
-
 def parse_input(data: list) -> Tuple[List[int], List[np.ndarray]]:
     """Parses the input into a list of bingo numbers to be drawn and a list of
     available bingo boards (as arrays)
@@ -56,51 +52,46 @@ def parse_input(data: list) -> Tuple[List[int], List[np.ndarray]]:
             current_board = []
 
     # Need to handle last board separately
-    if len(current_board) == BOARD_SIZE:
+    if current_board:
         boards.append(np.array(current_board))
 
     return numbers, boards
 
 
-def mark_boards(
-    num: int, *, boards: List[np.ndarray], masks: List[np.ndarray]
-) -> None:
-    """Marks the corresponding number on the bingo masks (in-place!)"""
-    for board, mask in zip(boards, masks):
-        mask[board == num] = True
+def compute_draw_times(numbers: List[int], boards: np.ndarray) -> np.ndarray:
+    """Maps each cell of the stacked boards to the index of the draw in which
+    its number is drawn. Cells with numbers that are never drawn are assigned
+    ``len(numbers)``, i.e. a draw that never happens.
 
-
-def check_for_bingo(
-    *, masks: List[np.ndarray], winners: List[int] = None
-) -> Tuple[List[int], int]:
-    """Returns the indices of the boards that have a full row or column masked.
-    If ``winners`` is given, skips boards with those numbers; this allows to
-    keep track of the number in which the winners were found.
-    Also returns the change in number of winning boards.
+    Args:
+        numbers (List[int]): The numbers to be drawn, in order
+        boards (np.ndarray): All boards stacked into a 3D array of shape
+            (# boards, # rows, # columns)
     """
-    winners = copy.copy(winners) if winners is not None else []
-    num_new_winners = 0
+    never = len(numbers)
+    dtype = np.min_scalar_type(never)
 
-    for board_no, mask in enumerate(masks):
-        if board_no in winners:
-            # Already know: this is a winner, don't check further
-            continue
+    # Lookup table from number to draw index; only the first draw counts
+    numbers = np.asarray(numbers)
+    size = max(numbers.max(initial=0), boards.max(initial=0)) + 1
+    lookup = np.full(size, never, dtype=dtype)
+    drawn, first_draw = np.unique(numbers, return_index=True)
+    lookup[drawn] = first_draw
 
-        for n in range(BOARD_SIZE):
-            if all(mask[:,n]) or all(mask[n,:]):
-                winners.append(board_no)
-                num_new_winners += 1
-                break
+    return lookup[boards]
 
-    return winners, num_new_winners
 
+def compute_win_times(draw_times: np.ndarray) -> np.ndarray:
+    """Computes the index of the draw in which each board wins.
 
-def print_boards(boards, masks):
-    """Prints all boards and masks"""
-    print(f"\n--- All {len(boards)} boards ---\n")
-    for n, (board, mask) in enumerate(zip(boards, masks)):
-        print(f"Board {n}:\n{board}\n{mask}\n")
-    print("-"*20)
+    A row (or column) is complete once its latest number has been drawn, i.e.
+    at the maximum draw index along it. The board wins with its earliest
+    completed row or column, i.e. at the minimum over those.
+    """
+    return np.minimum(
+        draw_times.max(axis=2).min(axis=1),
+        draw_times.max(axis=1).min(axis=1),
+    )
 
 
 def score_board(*, drawn_num: int, board: np.ndarray, mask: np.ndarray) -> int:
@@ -112,44 +103,138 @@ def score_board(*, drawn_num: int, board: np.ndarray, mask: np.ndarray) -> int:
     return sum_unmarked * drawn_num
 
 
+def play_bingo(
+    data: list
+) -> Tuple[List[int], np.ndarray, np.ndarray, np.ndarray]:
+    """Parses the input and evaluates the whole game at once.
+
+    Returns (numbers, stacked boards, per-cell draw times, per-board win times)
+    """
+    numbers, boards = parse_input(data)
+    boards = np.stack(boards)
+    print(f"Have {len(numbers)} to draw and {len(boards)} bingo boards of "
+          f"shape {boards.shape[1:]}. Let's play!")
+
+    draw_times = compute_draw_times(numbers, boards)
+    win_times = compute_win_times(draw_times)
+    return numbers, boards, draw_times, win_times
+
+
+class BingoHall:
+    """Incremental bingo engine for games in which numbers are drawn one at a
+    time.
+
+    Keeps an inverted index from each number to the cells it occupies on the
+    boards, as well as per-row and per-column hit counters. Drawing a number
+    thus only touches the cells holding that number rather than all boards.
+    Boards are reported as winners in the draw that completes them, together
+    with their score at that moment.
+    """
+
+    def __init__(self, boards: List[np.ndarray]):
+        """Sets up the bingo hall from a list of (equally shaped) boards
+
+        Args:
+            boards (List[np.ndarray]): The bingo boards, e.g. as returned by
+                :py:func:`parse_input`
+        """
+        self.boards = np.stack(boards)
+        n_boards, n_rows, n_cols = self.boards.shape
+
+        self.marked = np.zeros_like(self.boards, dtype=bool)
+        self.row_hits = np.zeros((n_boards, n_rows), dtype=int)
+        self.col_hits = np.zeros((n_boards, n_cols), dtype=int)
+        self.unmarked_sum = self.boards.sum(axis=(1, 2))
+
+        self.has_won = np.zeros(n_boards, dtype=bool)
+        self.winners = []  # board numbers, in order of winning
+        self.scores = {}   # board number -> score at time of winning
+        self.last_drawn = None
+
+        # Inverted index: number -> flat indices of the cells holding it
+        flat = self.boards.ravel()
+        order = np.argsort(flat, kind="stable")
+        nums, starts = np.unique(flat[order], return_index=True)
+        ends = np.append(starts[1:], flat.size)
+        self._index = {
+            int(num): order[start:end]
+            for num, start, end in zip(nums, starts, ends)
+        }
+
+    def draw(self, num: int) -> List[int]:
+        """Draws a number, marks it on all boards, and returns the numbers of
+        the boards that won with this draw (in ascending order).
+
+        This costs O(occurrences of ``num``). Drawing a number a second time
+        has no effect.
+        """
+        self.last_drawn = num
+
+        # Pop, such that repeatedly drawn numbers are not marked again
+        cells = self._index.pop(num, None)
+        if cells is None:
+            return []
+
+        b, r, c = np.unravel_index(cells, self.boards.shape)
+        self.marked[b, r, c] = True
+        np.add.at(self.row_hits, (b, r), 1)
+        np.add.at(self.col_hits, (b, c), 1)
+        np.subtract.at(self.unmarked_sum, b, num)
+
+        # Only rows and columns that were just hit can have been completed
+        _, n_rows, n_cols = self.boards.shape
+        completed = (
+            (self.row_hits[b, r] == n_cols) | (self.col_hits[b, c] == n_rows)
+        )
+        new_winners = np.unique(b[completed])
+        new_winners = new_winners[~self.has_won[new_winners]]
+        self.has_won[new_winners] = True
+
+        for board_no in new_winners.tolist():
+            self.winners.append(board_no)
+            self.scores[board_no] = int(self.unmarked_sum[board_no]) * num
+
+        return new_winners.tolist()
+
+    def score(self, board_no: int) -> int:
+        """Returns the score a board had at the time it won"""
+        try:
+            return self.scores[board_no]
+
+        except KeyError as err:
+            raise ValueError(f"Board {board_no} has not won (yet)!") from err
+
+    @property
+    def all_won(self) -> bool:
+        """Whether all boards have won"""
+        return len(self.winners) == len(self.boards)
+
 
 # -- Part 1 -------------------------------------------------------------------
 
 def solve_part1(*, input_mode: str) -> int:
     """Computes the solution for part 1: which board wins first?"""
     data = load_input(input_mode, **INPUT_KWARGS)
-    numbers, boards = parse_input(data)
-    print(f"Have {len(numbers)} to draw and {len(boards)} bingo boards. "
-          "Let's play!")
+    numbers, boards, draw_times, win_times = play_bingo(data)
 
-    # Generate corresponding masks
-    #   False:  number not yet selected
-    #   True:   number was selected
-    masks = [np.zeros_like(board, dtype=bool) for board in boards]
+    winner_no = int(np.argmin(win_times))
+    win_time = win_times[winner_no]
 
-    for n, drawn_num in enumerate(numbers):
-        print(f"Draw #{n:<2d}:  {drawn_num:2d}", end="")
-        mark_boards(drawn_num, boards=boards, masks=masks)
-
-        winners, _ = check_for_bingo(masks=masks)
-        if not winners:
-            print("  =>  no Bingo yet")
-            continue
-
-        elif len(winners) == 1:
-            winner_no = winners[0]
-            print(f"  =>  Bingo! on board {winner_no}\n")
-            break
+    if win_time == len(numbers):
+        raise RuntimeError("No winner!")
 
-        else:
-            print(f"  => Bingo! on multiple boards: {winners}")
-            raise NotImplementedError("Expected only a single winner ...")
+    winners = np.flatnonzero(win_times == win_time)
+    if len(winners) > 1:
+        print(f"Bingo! on multiple boards: {winners.tolist()}")
+        raise NotImplementedError("Expected only a single winner ...")
 
-    else:
-        raise RuntimeError("No winner!")
+    print(f"Draw #{win_time:<2d}:  {numbers[win_time]:2d}  =>  "
+          f"Bingo! on board {winner_no}\n")
 
     return score_board(
-        drawn_num=drawn_num, board=boards[winner_no], mask=masks[winner_no]
+        drawn_num=numbers[win_time],
+        board=boards[winner_no],
+        mask=draw_times[winner_no] <= win_time,
     )
 
 
@@ -158,45 +243,19 @@ def solve_part1(*, input_mode: str) -> int:
 def solve_part2(*, input_mode: str) -> int:
     """Computes the solution for part 2: which board wins last?"""
     data = load_input(input_mode, **INPUT_KWARGS)
-    numbers, boards = parse_input(data)
-    print(f"Have {len(numbers)} to draw and {len(boards)} bingo boards. "
-          "Let's play!")
-
-    winners = []
-    masks = [np.zeros_like(board, dtype=bool) for board in boards]
-    num_boards = len(boards)
-
-    for n, num in enumerate(numbers):
-        print(f"Draw #{n:<2d}:  {num:2d}", end="")
-        mark_boards(num, boards=boards, masks=masks)
-
-        winners, num_new = check_for_bingo(masks=masks, winners=winners)
-        # print_boards(boards, masks)
-        if not winners:
-            print("  =>  no Bingo yet")
-            continue
-
-        elif len(winners) < num_boards:
-            print(
-                "  =>  Bingo! on "
-                f"{len(winners):2d}/{num_boards:<2d} boards (Δ: {num_new})"
-            )
-            # print(f"  Winners:  {winners}")
-            continue
+    numbers, boards, draw_times, win_times = play_bingo(data)
 
-        else:
-            last_winner = winners[-1]
-            print(
-                f"  =>  all Bingo (Δ: {num_new})! "
-                f"Last one on board {last_winner}\n"
-            )
-            # print(f"  Winners:  {winners}")
-            break
-
-    else:
+    last_winner = int(np.argmax(win_times))
+    win_time = win_times[last_winner]
+
+    if win_time == len(numbers):
         raise RuntimeError("No winner!")
 
+    print(f"Draw #{win_time:<2d}:  {numbers[win_time]:2d}  =>  all Bingo! "
+          f"Last one on board {last_winner}\n")
+
     return score_board(
-        drawn_num=num, board=boards[last_winner], mask=masks[last_winner]
+        drawn_num=numbers[win_time],
+        board=boards[last_winner],
+        mask=draw_times[last_winner] <= win_time,
     )
-    
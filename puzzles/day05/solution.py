@@ -2,7 +2,10 @@
 
 For puzzle text, see: https://adventofcode.com/2021/day/5
 """
-from typing import List, Tuple
+import bisect
+import itertools
+from collections import defaultdict
+from typing import Dict, List, Set, Tuple
 
 import numpy as np
 
@@ -25,6 +28,15 @@ TEST_INPUT = """
 
 INPUT_KWARGS = dict(day=DAY, fpath=INPUT_FILE, test_input=TEST_INPUT)
 
+# Each orientation of lines is identified by the coefficients (c_x, c_y) of
+# the key  k = c_x * x + c_y * y  that is constant along such a line
+ORIENTATIONS = dict(
+    horizontal=(0, 1),   # y
+    vertical=(1, 0),     # x
+    diagonal=(1, -1),    # x - y
+    antidiagonal=(1, 1), # x + y
+)
+
 
 def parse_coords(line: str) -> Tuple[Tuple[int, int], Tuple[int, int]]:
     """Parses the coordinates of a single line from the input string"""
@@ -33,72 +45,441 @@ def parse_coords(line: str) -> Tuple[Tuple[int, int], Tuple[int, int]]:
     pt2 = [int(v) for v in pt2.split(",")]
     return tuple(pt1), tuple(pt2)
 
-def find_coords_maxval(lines) -> Tuple[int, int]:
-    """Finds the largest values in x and y coordinates"""
-    x_max, y_max = 0, 0
-    for (x1, y1), (x2, y2) in lines:
-        x_max = max(x_max, x1, x2)
-        y_max = max(y_max, y1, y2)
-
-    return x_max, y_max
-
-def mark_line(pt1, pt2, *, domain: np.ndarray) -> None:
-    """In-place marks a line pt1 -> pt2 in the domain"""
-    x1, y1 = pt1
-    x2, y2 = pt2
-    print(f"Line  ({x1:3d}, {y1:3d})  ->  ({x2:3d}, {y2:3d})  ... ", end="")
-
-    # Compute the required increment, which is used in the specification of the
-    # range function used in setting domain values
-    get_step = lambda c1, c2: +1 if c1 <= c2 else -1
-
-    # Distinguish horizontal and vertical lines
-    if x1 == x2:
-        y_step = get_step(y1, y2)
-        domain[x1, range(y1, y2 + y_step, y_step)] += 1
-        print("marked vertical line.")
-
-    elif y1 == y2:
-        x_step = get_step(x1, x2)
-        domain[range(x1, x2 + x_step, x_step), y1] += 1
-        print("marked horizontal line.")
-
-    elif abs(x2 - x1) == abs(y2 - y1):
-        x_step = get_step(x1, x2)
-        y_step = get_step(y1, y2)
-
-        for x, y in zip(
-            range(x1, x2 + x_step, x_step),
-            range(y1, y2 + y_step, y_step),
-        ):
-            domain[x, y] += 1
-        print("marked diagonal line.")
-
-    else:
+def find_coords_maxval(lines: np.ndarray) -> Tuple[int, int]:
+    """Finds the largest values in x and y coordinates
+
+    Args:
+        lines (np.ndarray): Line coordinates of shape (# lines, 2, 2), where
+            axis 1 selects the point and axis 2 the coordinate.
+    """
+    x_max, y_max = lines.max(axis=(0, 1), initial=0)
+    return int(x_max), int(y_max)
+
+def rasterize_lines(lines: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Expands all lines into the coordinates of the cells they cover.
+
+    This works for all lines in a single pass: each line ``pt1 -> pt2`` is
+    walked from ``pt1`` with a step of -1, 0, or +1 in each coordinate, which
+    covers horizontal, vertical, and exactly diagonal lines alike.
+
+    Args:
+        lines (np.ndarray): Line coordinates of shape (# lines, 2, 2)
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: x and y coordinates of all covered
+            cells; cells covered by multiple lines appear multiple times.
+    """
+    x1, y1 = lines[:, 0, 0], lines[:, 0, 1]
+    x2, y2 = lines[:, 1, 0], lines[:, 1, 1]
+    dx, dy = x2 - x1, y2 - y1
+
+    if np.any((dx != 0) & (dy != 0) & (np.abs(dx) != np.abs(dy))):
         raise NotImplementedError(
             "Cannot handle lines that are not horizontal, vertical, or "
             "exactly diagonal!"
         )
 
+    # Number of cells per line and, for each cell, the line it belongs to
+    # and its offset along that line
+    lengths = np.maximum(np.abs(dx), np.abs(dy)) + 1
+    line_idx = np.repeat(np.arange(len(lines)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(
+        np.cumsum(lengths) - lengths, lengths
+    )
 
-# -- Part 1 -------------------------------------------------------------------
+    x = x1[line_idx] + np.sign(dx)[line_idx] * offsets
+    y = y1[line_idx] + np.sign(dy)[line_idx] * offsets
+    return x, y
 
-def solve_part1(*, input_mode: str) -> int:
-    """Computes the solution for part 1"""
-    data = load_input(input_mode, **INPUT_KWARGS)
-    lines = [parse_coords(line) for line in data]
+def mark_lines(lines: np.ndarray, *, domain: np.ndarray) -> None:
+    """In-place marks all lines in the domain"""
+    x, y = rasterize_lines(lines)
+    np.add.at(domain, (x, y), 1)
+
+def build_domain(lines: np.ndarray) -> np.ndarray:
+    """Constructs the domain and marks all lines in it. The domain is indexed
+    as ``domain[x, y]``.
 
-    # Construct domain
+    Uses the smallest data type that can hold the number of lines (which is
+    the largest possible overlap count).
+    """
     x_max, y_max = find_coords_maxval(lines)
-    domain = np.zeros((x_max+1, y_max+1), dtype=int)
+    dtype = np.min_scalar_type(len(lines))
+    domain = np.zeros((x_max+1, y_max+1), dtype=dtype)
+    mark_lines(lines, domain=domain)
+    return domain
+
+
+class OverlapIndex:
+    """Answers queries on the number of dangerous cells, i.e. those with a
+    certain minimum overlap of lines, within rectangular regions.
+
+    Precomputes a 2D prefix sum (summed-area table) of the mask of dangerous
+    cells, such that each rectangle query is O(1) and batches of rectangles
+    can be answered in a single vectorized call.
+    """
+
+    def __init__(self, domain: np.ndarray, *, min_overlap: int = 2):
+        """Builds the index from a domain, e.g. from :py:func:`build_domain`
+
+        Args:
+            domain (np.ndarray): The domain with the line counts per cell
+            min_overlap (int, optional): The number of overlapping lines from
+                which on a cell is considered dangerous
+        """
+        self.shape = domain.shape
+        self.min_overlap = min_overlap
+
+        # Padded by a leading row and column of zeros, such that the sum over
+        # domain[:x, :y] is found at table[x, y]
+        dtype = np.min_scalar_type(domain.size)
+        self.table = np.zeros(
+            (self.shape[0] + 1, self.shape[1] + 1), dtype=dtype
+        )
+        np.cumsum(domain >= min_overlap, axis=0, out=self.table[1:, 1:])
+        np.cumsum(self.table[1:, 1:], axis=1, out=self.table[1:, 1:])
+
+    @property
+    def total(self) -> int:
+        """The number of dangerous cells in the whole domain"""
+        return int(self.table[-1, -1])
+
+    def count(self, x_min: int, y_min: int, x_max: int, y_max: int) -> int:
+        """Counts the dangerous cells in the rectangle spanning from
+        (x_min, y_min) to (x_max, y_max), both inclusive. The rectangle is
+        clipped to the domain.
+        """
+        return int(self.count_many([(x_min, y_min, x_max, y_max)])[0])
+
+    def count_many(self, rects) -> np.ndarray:
+        """Counts the dangerous cells for a batch of rectangles
+
+        Args:
+            rects: Array-like of shape (# rectangles, 4), each row holding the
+                inclusive bounds (x_min, y_min, x_max, y_max)
+
+        Returns:
+            np.ndarray: The number of dangerous cells in each rectangle
+        """
+        rects = np.asarray(rects).reshape(-1, 4)
+        x0 = np.clip(rects[:, 0], 0, self.shape[0])
+        y0 = np.clip(rects[:, 1], 0, self.shape[1])
+        x1 = np.clip(rects[:, 2] + 1, x0, self.shape[0])
+        y1 = np.clip(rects[:, 3] + 1, y0, self.shape[1])
+
+        # Cast before combining, avoiding wrap-around of unsigned types
+        corner = lambda x, y: self.table[x, y].astype(np.int64)
+        return (
+            corner(x1, y1) - corner(x0, y1) - corner(x1, y0) + corner(x0, y0)
+        )
+
+
+class OverlapCounter:
+    """Keeps track of the number of dangerous cells while lines are added to
+    or removed from the domain, only touching the cells of those lines.
+
+    The domain can be dense (an array of a fixed shape, indexed as
+    ``domain[x, y]``) or sparse (a dict mapping (x, y) to the line count of
+    all cells covered by at least one line).
+    """
+
+    def __init__(self, shape: Tuple[int, int] = None, *, min_overlap: int = 2):
+        """Sets up an empty domain
+
+        Args:
+            shape (Tuple[int, int], optional): If given, uses a dense domain
+                of this shape; otherwise a sparse one.
+            min_overlap (int, optional): The number of overlapping lines from
+                which on a cell is considered dangerous
+        """
+        self.min_overlap = min_overlap
+        self.num_dangerous = 0
+
+        if shape is not None:
+            self.domain = np.zeros(shape, dtype=np.int32)
+        else:
+            self.domain = dict()
+
+    @property
+    def is_sparse(self) -> bool:
+        """Whether the domain is sparse"""
+        return isinstance(self.domain, dict)
+
+    def add_segments(self, lines: np.ndarray) -> int:
+        """Adds a batch of lines, returns the updated number of dangerous
+        cells
+
+        Args:
+            lines (np.ndarray): Line coordinates of shape (# lines, 2, 2)
+        """
+        return self._update(lines, sign=+1)
+
+    def remove_segments(self, lines: np.ndarray) -> int:
+        """Removes a batch of previously added lines, returns the updated
+        number of dangerous cells
+
+        Args:
+            lines (np.ndarray): Line coordinates of shape (# lines, 2, 2)
+        """
+        return self._update(lines, sign=-1)
+
+    def _update(self, lines: np.ndarray, *, sign: int) -> int:
+        """Applies the change in line counts of all affected cells and updates
+        the number of dangerous cells from their state before and after.
+        """
+        lines = np.asarray(lines).reshape(-1, 2, 2)
+        x, y = rasterize_lines(lines)
+
+        # Aggregate cells appearing multiple times within this batch
+        cells, delta = np.unique(
+            np.stack((x, y), axis=1), axis=0, return_counts=True
+        )
+        delta = sign * delta
+
+        if self.is_sparse:
+            keys = [tuple(cell) for cell in cells.tolist()]
+            before = np.array(
+                [self.domain.get(key, 0) for key in keys], dtype=np.int64
+            )
+        else:
+            if np.any(cells < 0) or np.any(cells >= self.domain.shape):
+                raise ValueError(
+                    f"Lines exceed the domain of shape {self.domain.shape}!"
+                )
+            before = self.domain[cells[:, 0], cells[:, 1]]
+
+        after = before + delta
+        if np.any(after < 0):
+            raise ValueError("Cannot remove lines that were not added before!")
+
+        if self.is_sparse:
+            for key, count in zip(keys, after.tolist()):
+                if count:
+                    self.domain[key] = count
+                else:
+                    del self.domain[key]
+        else:
+            self.domain[cells[:, 0], cells[:, 1]] = after
+
+        self.num_dangerous += int(
+            np.sum(after >= self.min_overlap)
+            - np.sum(before >= self.min_overlap)
+        )
+        return self.num_dangerous
+
+
+# -- Sparse overlap counting --------------------------------------------------
+# Lines are grouped by orientation and key, such that all lines in a group are
+# collinear. Their cells are then described by intervals of a parameter t
+# along the line (t = y for vertical lines, t = x otherwise), which allows to
+# count overlaps without allocating the domain.
+
+def cell_on_line(orientation: str, key: int, t: int) -> Tuple[int, int]:
+    """Returns the (x, y) coordinates of the cell at parameter ``t`` along the
+    line with the given orientation and key
+    """
+    if orientation == "horizontal":
+        return t, key
+    elif orientation == "vertical":
+        return key, t
+    elif orientation == "diagonal":
+        return t, t - key
+    return t, key - t
+
+def line_param(orientation: str, x: int, y: int) -> int:
+    """Returns the parameter t of a cell along a line of given orientation"""
+    return y if orientation == "vertical" else x
+
+def group_collinear(lines: np.ndarray) -> Dict[Tuple[str, int], list]:
+    """Groups lines by orientation and key, representing each line by its
+    (first, last) parameter interval along that key's line.
+    """
+    groups = defaultdict(list)
+    for (x1, y1), (x2, y2) in lines.tolist():
+        dx, dy = x2 - x1, y2 - y1
+        if dy == 0:
+            orientation = "horizontal"
+        elif dx == 0:
+            orientation = "vertical"
+        elif dx == dy:
+            orientation = "diagonal"
+        elif dx == -dy:
+            orientation = "antidiagonal"
+        else:
+            raise NotImplementedError(
+                "Cannot handle lines that are not horizontal, vertical, or "
+                "exactly diagonal!"
+            )
+
+        cx, cy = ORIENTATIONS[orientation]
+        t1 = line_param(orientation, x1, y1)
+        t2 = line_param(orientation, x2, y2)
+        groups[(orientation, cx*x1 + cy*y1)].append((min(t1, t2), max(t1, t2)))
+
+    return groups
+
+def merge_intervals(intervals: list) -> Tuple[list, list]:
+    """Sweeps over a group of collinear intervals and returns two lists of
+    disjoint, sorted intervals: the cells covered at least once and the cells
+    covered at least twice.
+    """
+    covered, overlaps = [], []
+    reach = None  # largest parameter value covered so far
+
+    for start, end in sorted(intervals):
+        if reach is not None and start <= reach:
+            # Part of this interval is already covered: an overlap
+            ov_start, ov_end = start, min(end, reach)
+            if overlaps and ov_start <= overlaps[-1][1] + 1:
+                overlaps[-1][1] = max(overlaps[-1][1], ov_end)
+            else:
+                overlaps.append([ov_start, ov_end])
+
+        if covered and start <= covered[-1][1] + 1:
+            covered[-1][1] = max(covered[-1][1], end)
+        else:
+            covered.append([start, end])
+
+        reach = end if reach is None else max(reach, end)
+
+    return covered, overlaps
+
+def find_crossings(
+    covered: Dict[str, list], orient_a: str, orient_b: str
+) -> Set[Tuple[int, int]]:
+    """Finds all cells that are covered by lines of both orientations.
+
+    Two lines of different orientation cross in at most one point. Expressed
+    in the keys of the two orientations, a line of orientation A is a segment
+    at constant key A that spans a range of B keys, and vice versa. This is
+    the classic orthogonal segment intersection problem, solved by a sweep
+    over the A keys that keeps the active B keys in a sorted list.
+
+    Args:
+        covered (Dict[str, list]): For each orientation, a list of
+            (key, start, end) tuples of disjoint covered intervals
+        orient_a (str): The first orientation
+        orient_b (str): The second orientation
+    """
+    ca = ORIENTATIONS[orient_a]
+    cb = ORIENTATIONS[orient_b]
+    key_a = lambda x, y: ca[0]*x + ca[1]*y
+    key_b = lambda x, y: cb[0]*x + cb[1]*y
+
+    # Diagonal and antidiagonal keys of the same cell have the same parity;
+    # for other crossings, all key combinations correspond to a cell
+    check_parity = {orient_a, orient_b} == {"diagonal", "antidiagonal"}
+
+    # Events along the A key axis:  (position, kind, ...)
+    #   kind 0: B interval becomes active   (before queries at same position)
+    #   kind 1: A interval queries active B keys
+    #   kind 2: B interval becomes inactive (after queries at same position)
+    events = []
+    for key, start, end in covered[orient_b]:
+        ends = [key_a(*cell_on_line(orient_b, key, t)) for t in (start, end)]
+        events.append((min(ends), 0, key))
+        events.append((max(ends), 2, key))
+
+    for key, start, end in covered[orient_a]:
+        ends = [key_b(*cell_on_line(orient_a, key, t)) for t in (start, end)]
+        events.append((key, 1, min(ends), max(ends)))
+
+    active = []  # sorted B keys
+    crossings = set()
+    det = ca[0]*cb[1] - ca[1]*cb[0]
+
+    for pos, kind, *args in sorted(events):
+        if kind == 0:
+            bisect.insort(active, args[0])
+
+        elif kind == 2:
+            del active[bisect.bisect_left(active, args[0])]
+
+        else:
+            lo, hi = args
+            for kb in active[
+                bisect.bisect_left(active, lo):bisect.bisect_right(active, hi)
+            ]:
+                if check_parity and (pos + kb) % 2:
+                    continue
+
+                # Solve  ca . (x, y) = pos  and  cb . (x, y) = kb
+                x = (pos * cb[1] - ca[1] * kb) // det
+                y = (ca[0] * kb - pos * cb[0]) // det
+                crossings.add((x, y))
+
+    return crossings
+
+def count_overlaps_sparse(lines: np.ndarray) -> int:
+    """Counts the cells that are covered by at least two lines, without
+    allocating the domain. Memory is proportional to the number of lines and
+    the number of crossings between them, not to the bounding box.
+
+    A cell is covered at least twice if lines of the same orientation overlap
+    there or if it is covered by lines of at least two orientations. With D_k
+    denoting the overlaps within orientation k and X the set of cells covered
+    by at least two orientations, the count is given by
+
+        sum_k |D_k|  +  sum_{p in X} (1 - d(p))
+
+    where d(p) is the number of orientations in whose overlaps p lies. This
+    corrects for cells counted multiple times or not at all in the first sum.
+
+    Args:
+        lines (np.ndarray): Line coordinates of shape (# lines, 2, 2)
+    """
+    covered = {orientation: [] for orientation in ORIENTATIONS}
+    overlaps = defaultdict(dict)  # orientation -> key -> sorted intervals
+    num_overlaps = 0
+
+    for (orientation, key), intervals in group_collinear(lines).items():
+        cov, ovl = merge_intervals(intervals)
+        covered[orientation] += [(key, start, end) for start, end in cov]
+        if ovl:
+            overlaps[orientation][key] = ovl
+            num_overlaps += sum(end - start + 1 for start, end in ovl)
+
+    crossings = set()
+    for orient_a, orient_b in itertools.combinations(ORIENTATIONS, 2):
+        crossings |= find_crossings(covered, orient_a, orient_b)
+
+    def in_overlaps(orientation: str, x: int, y: int) -> bool:
+        cx, cy = ORIENTATIONS[orientation]
+        ovl = overlaps[orientation].get(cx*x + cy*y)
+        if not ovl:
+            return False
+        t = line_param(orientation, x, y)
+        idx = bisect.bisect_right(ovl, [t, float("inf")]) - 1
+        return idx >= 0 and ovl[idx][1] >= t
+
+    for x, y in crossings:
+        num_overlaps += 1 - sum(in_overlaps(o, x, y) for o in ORIENTATIONS)
+
     print(
-        f"Have {len(lines)} lines of hydrothermal vents "
-        f"in a domain of shape {domain.shape}."
+        f"Found {len(crossings)} cells covered by lines of different "
+        "orientation."
     )
+    return num_overlaps
+
+
+# -- Part 1 -------------------------------------------------------------------
+
+def solve_part1(*, input_mode: str, sparse: bool = False) -> int:
+    """Computes the solution for part 1
+
+    If ``sparse`` is set, overlaps are counted without allocating the domain,
+    which allows coordinates far beyond what fits into memory as a dense map.
+    """
+    data = load_input(input_mode, **INPUT_KWARGS)
+    lines = np.array([parse_coords(line) for line in data]).reshape(-1, 2, 2)
 
-    for line in lines:
-        mark_line(*line, domain=domain)
+    if sparse:
+        print(f"Have {len(lines)} lines of hydrothermal vents.")
+        return count_overlaps_sparse(lines)
 
+    print(f"Have {len(lines)} lines of hydrothermal vents.")
+    domain = build_domain(lines)
+    print(f"Marked them in a domain of shape {domain.shape}.")
     print(f"\nFinal domain map:\n{domain.T}")
 
     # Count points where at least two lines overlap
@@ -107,7 +488,7 @@ def solve_part1(*, input_mode: str) -> int:
 
 # -- Part 2 -------------------------------------------------------------------
 
-def solve_part2(*, input_mode: str) -> int:
+def solve_part2(*, input_mode: str, sparse: bool = False) -> int:
     """Computes the solution for part 2"""
-    return solve_part1(input_mode=input_mode)
+    return solve_part1(input_mode=input_mode, sparse=sparse)
     
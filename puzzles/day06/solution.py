@@ -2,7 +2,9 @@
 
 For puzzle text, see: https://adventofcode.com/2021/day/6
 """
-from typing import List
+from typing import List, Sequence
+
+import numpy as np
 
 from ..tools import relative_to_file, load_input
 
@@ -30,6 +32,111 @@ def procreate_lanternfish_naive(ages: List[int]) -> List[int]:
     ages = [age if age >= 0 else 6 for age in ages]
     return ages
 
+# Transition matrix of the age distribution over one day, i.e. the matrix M
+# for which  distr_new = M @ distr
+TRANSITION_MATRIX = [
+    [1 if (i + 1 == j) or (j == 0 and i in (6, 8)) else 0 for j in range(9)]
+    for i in range(9)
+]
+
+def matmul(a: List[List[int]], b: List[List[int]], *, mod: int = None):
+    """Multiplies two matrices (as lists of lists), optionally modulo ``mod``.
+    Uses Python integers such that results are exact.
+    """
+    b_cols = list(zip(*b))
+    prod = [
+        [sum(x * y for x, y in zip(row, col)) for col in b_cols] for row in a
+    ]
+    if mod is not None:
+        prod = [[v % mod for v in row] for row in prod]
+    return prod
+
+def matpow(m: List[List[int]], n: int, *, mod: int = None):
+    """Raises a square matrix to the power ``n`` by repeated squaring"""
+    result = [[int(i == j) for j in range(len(m))] for i in range(len(m))]
+    while n:
+        if n & 1:
+            result = matmul(result, m, mod=mod)
+        m = matmul(m, m, mod=mod)
+        n >>= 1
+    return result
+
+def project_age_distribution(
+    distr: List[int], days: int, *, mod: int = None
+) -> List[int]:
+    """Projects the age distribution ``days`` into the future using the
+    transition matrix raised to that power, requiring only O(log(days))
+    matrix multiplications.
+
+    Args:
+        distr (List[int]): The initial age distribution (9 age brackets)
+        days (int): The number of days to project
+        mod (int, optional): If given, computes the result modulo this value
+    """
+    if days < 0:
+        raise ValueError(f"Cannot project a negative number of days: {days}")
+
+    m = matpow(TRANSITION_MATRIX, days, mod=mod)
+    return [row[0] for row in matmul(m, [[n] for n in distr], mod=mod)]
+
+def age_distributions(schools: Sequence[Sequence[int]]) -> np.ndarray:
+    """Computes the age distributions of many schools of lanternfish with a
+    single ``np.bincount`` call, returning an array of shape (# schools, 9)
+    """
+    sizes = [len(ages) for ages in schools]
+    school_idx = np.repeat(np.arange(len(schools)), sizes)
+    ages = np.concatenate([np.asarray(ages, dtype=int) for ages in schools])
+
+    return np.bincount(
+        school_idx * 9 + ages, minlength=len(schools) * 9
+    ).reshape(-1, 9)
+
+def simulate_many(
+    distrs: np.ndarray, horizons: Sequence[int], *, dtype=np.int64
+) -> np.ndarray:
+    """Simulates many age distributions at once and returns the population
+    sizes at each of the given horizons.
+
+    All distributions are advanced together in a single sweep up to the
+    largest horizon, recording the population sizes whenever a requested
+    horizon is passed. The age brackets are stored as a ring buffer, such that
+    each day only requires adding one column to another.
+
+    Args:
+        distrs (np.ndarray): The age distributions, shape (# schools, 9)
+        horizons (Sequence[int]): The days after which to record the
+            population sizes
+        dtype (optional): The data type to compute in. Note that ``int64``
+            overflows after a few hundred days, depending on the school size;
+            pass ``object`` to compute with exact Python integers.
+
+    Returns:
+        np.ndarray: Population sizes of shape (# schools, # horizons)
+    """
+    horizons = np.asarray(horizons, dtype=int)
+    if np.any(horizons < 0):
+        raise ValueError(f"Horizons need to be non-negative, got {horizons}!")
+
+    distrs = np.array(distrs, dtype=dtype).reshape(-1, 9)
+    results = np.zeros((len(distrs), len(horizons)), dtype=dtype)
+
+    # Visit the horizons in ascending order, storing at their original index
+    order = np.argsort(horizons, kind="stable")
+    day = 0
+    zero_age = 0  # index of the bracket of age 0 in the ring buffer
+
+    for idx in order:
+        while day < horizons[idx]:
+            # The age 0 bracket becomes the age 8 bracket (offspring) by
+            # moving the ring buffer; the parents are added to age 6
+            distrs[:, (zero_age + 7) % 9] += distrs[:, zero_age]
+            zero_age = (zero_age + 1) % 9
+            day += 1
+
+        results[:, idx] = distrs.sum(axis=1)
+
+    return results
+
 def procreate_lanternfish_age_distribution(distr: List[int]) -> List[int]:
     """Uses the age distribution for simulating procreation"""
     # Determine number of procreating offspring
@@ -64,19 +171,21 @@ def solve_part1(*, input_mode: str, days: int = 80) -> int:
 
 # -- Part 2 -------------------------------------------------------------------
 
-def solve_part2(*, input_mode: str, days: int = 256) -> int:
+def solve_part2(
+    *, input_mode: str, days: int = 256, mod: int = None
+) -> int:
     """Computes the solution for part 2"""
     data = load_input(input_mode, **INPUT_KWARGS)
     ages = parse_input(data[0])  # single line
 
     # Create an age distribution list
     age_distr = [ages.count(n) for n in range(9)]
-
-
     print(f"Initial state: {sum(age_distr)} fish ({age_distr})")
-    for day in range(1, days+1):
-        age_distr = procreate_lanternfish_age_distribution(age_distr)
-        print(f"After day {day:2d}:  {sum(age_distr)} fish ({age_distr})")
 
-    return sum(age_distr)
+    # Instead of iterating day by day, project directly to the last day
+    age_distr = project_age_distribution(age_distr, days, mod=mod)
+    print(f"After day {days:2d}:  {sum(age_distr)} fish ({age_distr})")
+
+    total = sum(age_distr)
+    return total if mod is None else total % mod
     
@@ -2,7 +2,9 @@
 
 For puzzle text, see: https://adventofcode.com/2021/day/7
 """
-from typing import List
+from typing import Callable, List, Tuple
+
+import numpy as np
 
 from ..tools import relative_to_file, load_input
 
@@ -49,32 +51,124 @@ def solve_part1(*, input_mode: str) -> int:
 
 # -- Part 2 -------------------------------------------------------------------
 
-def solve_part2(*, input_mode: str, dx: int = 10) -> int:
-    """Computes the solution for part 2"""
-    def compute_fuel_consumption(positions: List[int], target: int) -> int:
-        return sum(
-            sum(n for n in range(abs(x-target) + 1)) for x in positions
+def linear_fuel(distance: np.ndarray) -> np.ndarray:
+    """Fuel model of part 1: each step costs 1 unit of fuel"""
+    return distance
+
+def triangular_fuel(distance: np.ndarray) -> np.ndarray:
+    """Fuel model of part 2: the n-th step costs n units of fuel, such that
+    moving a distance d costs the d-th triangular number, d (d + 1) / 2.
+    """
+    return distance * (distance + 1) // 2
+
+def compute_fuel_consumption(
+    positions: np.ndarray, target: int, *, cost: Callable = triangular_fuel
+) -> int:
+    """Computes the total fuel consumption for all crabs to move to target
+
+    Args:
+        positions (np.ndarray): The crab positions
+        target (int): The target position
+        cost (Callable, optional): The fuel model, mapping an array of
+            distances to an array of fuel consumptions
+    """
+    return int(np.sum(cost(np.abs(positions - target))))
+
+def find_optimal_target(
+    positions: np.ndarray, *, cost: Callable = triangular_fuel
+) -> Tuple[int, int]:
+    """Finds the integer target position with the smallest total fuel
+    consumption.
+
+    For a fuel model that is convex and non-decreasing in the distance, the
+    total fuel consumption is convex in the target position, i.e. its forward
+    difference is non-decreasing. The optimum is thus the smallest target at
+    which the forward difference is no longer negative, which is found by
+    bisection over the range of positions in O(n log(range)).
+
+    Returns (target position, fuel consumption)
+    """
+    fuel = lambda t: compute_fuel_consumption(positions, t, cost=cost)
+
+    lo, hi = int(positions.min()), int(positions.max())
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if fuel(mid + 1) - fuel(mid) >= 0:
+            hi = mid
+        else:
+            lo = mid + 1
+
+    return lo, fuel(lo)
+
+def cost_curve(
+    positions: np.ndarray, *, cost: Callable = triangular_fuel
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Computes the total fuel consumption for *every* target position within
+    the range of crab positions at once, in O(n + range).
+
+    Positions are binned into a histogram of counts c_i over the range. The
+    costs are then derived from prefix sums of c_i and of i c_i, which give
+    the sum of distances to all crabs left and right of each target. For the
+    triangular model, d (d + 1) / 2 is decomposed into the sum of distances
+    and the sum of squared distances; the latter follows directly from the
+    total moments of the histogram.
+
+    Args:
+        positions (np.ndarray): The crab positions
+        cost (Callable, optional): The fuel model; only the linear and the
+            triangular fuel models are supported here.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: target positions and their costs
+    """
+    if cost not in (linear_fuel, triangular_fuel):
+        raise ValueError(
+            "Cost curves can only be computed for the linear and the "
+            f"triangular fuel model, not for {cost}!"
         )
 
-    positions = parse_input(load_input(input_mode, **INPUT_KWARGS)[0])
-    if input_mode == "test":
-        print(positions)
+    offset = int(positions.min())
+    counts = np.bincount(np.asarray(positions) - offset).astype(np.int64)
+    i = np.arange(len(counts), dtype=np.int64)
+
+    # Number and position sum of crabs at or left of each target ...
+    n_left = np.cumsum(counts)
+    w_left = np.cumsum(i * counts)
+
+    # ... and right of it
+    n_right = n_left[-1] - n_left
+    w_right = w_left[-1] - w_left
 
-    # Look around the mean position for smallest values
-    mean_pos = round(sum(positions)/len(positions))
-    print(f"Mean position:  {mean_pos}\n")
+    sum_dist = (i * n_left - w_left) + (w_right - i * n_right)
+    if cost is linear_fuel:
+        return i + offset, sum_dist
+
+    # Sum of squared distances:  sum_j c_j (j - i)^2
+    sum_sq_dist = (
+        np.sum(i**2 * counts) - 2 * i * w_left[-1] + i**2 * n_left[-1]
+    )
+    return i + offset, (sum_sq_dist + sum_dist) // 2
 
-    test_target = [t for t in range(mean_pos - dx, mean_pos + dx + 1)]
-    test_fuel = [compute_fuel_consumption(positions, t) for t in test_target]
 
-    for _target, _fuel in zip(test_target, test_fuel):
-        print(f"target {_target:3d} : {_fuel}")
+def solve_part2(*, input_mode: str, histogram: bool = False) -> int:
+    """Computes the solution for part 2
 
-    target_pos = test_target[test_fuel.index(min(test_fuel))]
+    If ``histogram`` is set, the whole cost curve is computed from a histogram
+    of the positions and its minimum is selected.
+    """
+    positions = parse_input(load_input(input_mode, **INPUT_KWARGS)[0])
+    if input_mode == "test":
+        print(positions)
+
+    if histogram:
+        targets, costs = cost_curve(
+            np.array(positions, dtype=np.int64), cost=triangular_fuel
+        )
+        print(f"Smallest fuel consumption at:  {targets[np.argmin(costs)]}")
+        return int(costs.min())
 
-    print(
-        f"Smallest fuel consumption (for target positions {mean_pos} ± {dx}) "
-        f"at:  {target_pos}"
+    target_pos, fuel = find_optimal_target(
+        np.array(positions, dtype=np.int64), cost=triangular_fuel
     )
-    return compute_fuel_consumption(positions, target_pos)
-    
+    print(f"Smallest fuel consumption at:  {target_pos}")
+    return fuel
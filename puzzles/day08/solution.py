@@ -2,7 +2,11 @@
 
 For puzzle text, see: https://adventofcode.com/2021/day/8
 """
-from typing import Dict, List
+import functools
+import itertools
+from typing import Dict, List, Tuple
+
+import numpy as np
 
 from ..tools import relative_to_file, load_input
 
@@ -55,115 +59,164 @@ def solve_part1(*, input_mode: str) -> int:
 
 # -- Part 2 -------------------------------------------------------------------
 
-def item(s):
-    """Returns the only element from a container, raises otherwise"""
-    s = list(s)
-    if len(s) != 1:
-        raise ValueError(f"Given object has {len(s)} != 1 items! {s}")
-    return s[0]
-
-def determine_encoding(
-    patterns: List[List[str]], *, verbose: bool
-) -> Dict[str, int]:
-    """Determines the mapping from patterns to digits"""
-    # Easy digits first
-    encoding = {
-        pattern: EASY_PATTERNS.get(len(pattern)) for pattern in patterns
-    }
-
-    # Function to get the inverse encoding as a set
-    def get_pattern(digit: int) -> set:
-        candidates = [pat for pat, dig in encoding.items() if dig == digit]
-        if len(candidates) != 1:
-            raise ValueError(
-                f"No (or no unambiguous) pattern found for digit {digit}!"
-            )
-        return set(candidates[0])
-
-    # Start deducing patterns using set operations
-    #   & : intersection
-    #   | : union
-    #   - : difference
-    #   ^ : symmetric difference
-
-    # - Digit 3 is the 5-segment pattern with overlap to 1 of 2:
-    #   Both 5 and 2 only have an overlap of 1. Notation:
-    #   #(3 & 1) = 2
-    #
-    #   The remaining 5-segment patterns differ in their overlap to 4:
-    #   #(5 & 4) = 3
-    #   #(2 & 4) = 2
-    pat3 = item(
-        p for p in patterns
-        if len(p) == 5 and len(set(p) & get_pattern(1)) == 2
-    )
-    pat5 = item(
-        p for p in patterns
-        if len(p) == 5 and p != pat3 and len(set(p) & get_pattern(4)) == 3
-    )
-    pat2 = item(
-        p for p in patterns if len(p) == 5 and p not in (pat3, pat5)
-    )
-
-    encoding[pat3] = 3
-    encoding[pat5] = 5
-    encoding[pat2] = 2
-
-    # - Among the 6-segment patterns, the overlap is as follows
-    #   #(6 & 1) = 1
-    #   #(9 & 1) = 2
-    #   #(0 & 1) = 2
-    #
-    #   #(9 & 3) = 5
-    #   #(0 & 3) = 4
-    pat6 = item(
-        p for p in patterns
-        if len(p) == 6 and len(set(p) & get_pattern(1)) == 1
-    )
-    pat9 = item(
-        p for p in patterns
-        if len(p) == 6 and p != pat6 and len(set(p) & get_pattern(3)) == 5
-    )
-    pat0 = item(
-        p for p in patterns if len(p) == 6 and p not in (pat6, pat9)
-    )
-
-    encoding[pat6] = 6
-    encoding[pat9] = 9
-    encoding[pat0] = 0
-
-    if verbose:
-        _fmt = lambda pat: f"{pat if pat is not None else '':>7}"
-        print(f"Patterns:  {' '.join(_fmt(pat) for pat in patterns)}")
-        print(f"Encoding:  {' '.join(_fmt(v) for v in encoding.values())}")
+SEGMENTS = "abcdefg"
+DIGIT_PATTERNS = {  # digit -> segments of the unscrambled display
+    0: "abcefg",
+    1: "cf",
+    2: "acdeg",
+    3: "acdfg",
+    4: "bcdf",
+    5: "abdfg",
+    6: "abdefg",
+    7: "acf",
+    8: "abcdefg",
+    9: "abcdfg",
+}
 
-    return encoding
+def to_mask(pattern: str) -> int:
+    """Encodes a pattern as a 7-bit mask, segment ``a`` being the lowest bit"""
+    return sum(1 << SEGMENTS.index(c) for c in pattern)
+
+@functools.lru_cache(maxsize=None)
+def decoding_tables() -> Dict[Tuple[int, ...], Dict[int, int]]:
+    """Precomputes the decoding tables for all 5040 possible wirings.
+
+    Each wiring is identified by the sorted tuple of the masks of its ten
+    patterns, which is the same regardless of the order in which a display
+    shows its patterns. It maps to the table from mask to digit.
+    """
+    tables = dict()
+    for wiring in itertools.permutations(range(len(SEGMENTS))):
+        table = {
+            sum(1 << wiring[SEGMENTS.index(c)] for c in pattern): digit
+            for digit, pattern in DIGIT_PATTERNS.items()
+        }
+        tables[tuple(sorted(table))] = table
+
+    return tables
+
+def decode_display(patterns: List[str], outputs: List[str]) -> int:
+    """Decodes the output value of a single display by looking up the table
+    that corresponds to its set of patterns
+    """
+    signature = tuple(sorted(to_mask(p) for p in patterns))
+    try:
+        table = decoding_tables()[signature]
+
+    except KeyError as err:
+        raise ValueError(
+            f"The patterns {patterns} do not correspond to any wiring!"
+        ) from err
+
+    value = 0
+    for output in outputs:
+        value = 10 * value + table[to_mask(output)]
+    return value
+
+# .. Bulk decoding ............................................................
+# Rather than identifying the wiring, digits are identified by properties that
+# do not depend on it: the number of segments and the number of segments
+# shared with the (easily identified) patterns of digits 1 and 4.
+
+POPCOUNT = np.array([bin(m).count("1") for m in range(128)], dtype=np.uint8)
+
+def _digit_key(num_segments, overlap1, overlap4):
+    """Combines the wiring-independent properties of a pattern into a key"""
+    return (num_segments * 3 + overlap1) * 5 + overlap4
+
+def _build_digit_lookup() -> np.ndarray:
+    """Builds the table from digit key to digit, -1 denoting invalid keys"""
+    masks = {digit: to_mask(pat) for digit, pat in DIGIT_PATTERNS.items()}
+    lookup = np.full(_digit_key(7, 2, 4) + 1, -1, dtype=np.int8)
+    for digit, mask in masks.items():
+        lookup[_digit_key(
+            POPCOUNT[mask],
+            POPCOUNT[mask & masks[1]],
+            POPCOUNT[mask & masks[4]],
+        )] = digit
+    return lookup
+
+DIGIT_LOOKUP = _build_digit_lookup()
+
+def parse_displays(data: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Parses all displays into arrays of pattern masks of shape (N, 10) and
+    output masks of shape (N, 4), both of type ``uint8``.
+
+    All lines are tokenized at once: each letter contributes its bit to the
+    mask of the token it belongs to, which is found by counting the token
+    starts (letters not preceded by a letter) up to it.
+    """
+    chars = np.frombuffer("\n".join(data).encode("ascii"), dtype=np.uint8)
+
+    is_letter = (chars >= ord("a")) & (chars <= ord("g"))
+    is_start = is_letter & ~np.concatenate(([False], is_letter[:-1]))
+    token_idx = np.cumsum(is_start)[is_letter] - 1
+    bits = np.left_shift(1, chars[is_letter] - ord("a"))
+
+    num_tokens = 14 * len(data)
+    if token_idx[-1] + 1 != num_tokens:
+        raise ValueError(
+            f"Expected {num_tokens} patterns for {len(data)} displays, but "
+            f"got {token_idx[-1] + 1}!"
+        )
 
+    # As segments do not repeat within a pattern, summing the bits is the
+    # same as combining them with bitwise or
+    masks = np.bincount(token_idx, weights=bits, minlength=num_tokens)
+    masks = masks.astype(np.uint8).reshape(-1, 14)
+
+    return masks[:, :10], masks[:, 10:]
+
+def decode_displays(patterns: np.ndarray, outputs: np.ndarray) -> np.ndarray:
+    """Decodes the output values of all displays at once
+
+    Args:
+        patterns (np.ndarray): Pattern masks of shape (N, 10)
+        outputs (np.ndarray): Output masks of shape (N, 4)
+
+    Returns:
+        np.ndarray: The decoded output values, shape (N,)
+    """
+    rows = np.arange(len(patterns))
+    num_segments = POPCOUNT[patterns]
+    mask1 = patterns[rows, np.argmax(num_segments == 2, axis=1)][:, None]
+    mask4 = patterns[rows, np.argmax(num_segments == 4, axis=1)][:, None]
+
+    digits = DIGIT_LOOKUP[_digit_key(
+        POPCOUNT[outputs].astype(np.intp),
+        POPCOUNT[outputs & mask1],
+        POPCOUNT[outputs & mask4],
+    )]
+    if np.any(digits < 0):
+        raise ValueError(
+            f"Could not decode {np.sum(np.any(digits < 0, axis=1))} displays!"
+        )
 
-def decode(outputs, *, encoding: Dict[str, int], verbose: bool) -> int:
-    """Decodes a list of output patterns to an integer"""
-    res = int("".join(str(encoding[pat]) for pat in outputs))
-    if verbose:
-        print(f"Decoding output ...  {' '.join(outputs)}  ==>  {res}\n")
+    return digits.astype(np.int64) @ np.array([1000, 100, 10, 1])
 
-    return res
 
+def solve_part2(*, input_mode: str, bulk: bool = False) -> int:
+    """Computes the solution for part 2
 
-def solve_part2(*, input_mode: str) -> int:
-    """Computes the solution for part 2"""
+    If ``bulk`` is set, all displays are decoded at once using array
+    operations rather than one after the other.
+    """
     verbose = (input_mode == "test")
     data = load_input(input_mode, **INPUT_KWARGS)
 
-    sort = lambda pat: "".join(sorted(pat))
-    all_patterns = [[sort(p) for p in l.split("|")[0].split()] for l in data]
-    all_outputs = [[sort(p) for p in l.split("|")[1].split()] for l in data]
+    if bulk:
+        return int(np.sum(decode_displays(*parse_displays(data))))
+
+    all_patterns = [l.split("|")[0].split() for l in data]
+    all_outputs = [l.split("|")[1].split() for l in data]
 
     all_decoded_outputs = []
 
     for patterns, outputs in zip(all_patterns, all_outputs):
-        encoding = determine_encoding(patterns, verbose=verbose)
-        all_decoded_outputs.append(
-            decode(outputs, encoding=encoding, verbose=verbose)
-        )
+        res = decode_display(patterns, outputs)
+        if verbose:
+            print(f"Decoding output ...  {' '.join(outputs)}  ==>  {res}")
+
+        all_decoded_outputs.append(res)
 
     return sum(all_decoded_outputs)
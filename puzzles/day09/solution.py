@@ -2,7 +2,8 @@
 
 For puzzle text, see: https://adventofcode.com/2021/day/9
 """
-from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Tuple
 
 import numpy as np
 
@@ -20,33 +21,33 @@ TEST_INPUT = """
 
 INPUT_KWARGS = dict(day=DAY, fpath=INPUT_FILE, test_input=TEST_INPUT)
 
-PAD_CONSTANT = 9
-
 # -- Part 1 -------------------------------------------------------------------
 
-def find_low_points(hmap: np.ndarray) -> list:
-    """Returns a list of (y, x) coordinates of low points in the height map"""
+def low_point_mask(hmap: np.ndarray) -> np.ndarray:
+    """Returns a boolean mask of the low points in the height map"""
+    # Cells at the boundary lack some neighbours; these comparisons are simply
+    # skipped, avoiding the need for padding
+    is_low = np.ones_like(hmap, dtype=bool)
+    is_low[1:, :] &= hmap[1:, :] < hmap[:-1, :]
+    is_low[:-1, :] &= hmap[:-1, :] < hmap[1:, :]
+    is_low[:, 1:] &= hmap[:, 1:] < hmap[:, :-1]
+    is_low[:, :-1] &= hmap[:, :-1] < hmap[:, 1:]
+    return is_low
+
+def find_low_points(hmap: np.ndarray) -> Tuple[np.ndarray, int]:
+    """Finds the low points in the height map by comparing the whole map to
+    shifted views of itself, one for each (von Neumann) neighbour direction.
+
+    Returns (array of (y, x) coordinates of the low points, sum of risk levels)
+    """
     print("Looking for low points ...")
+    is_low = low_point_mask(hmap)
 
-    # Add padding to avoid needing boundary checks
-    print("  Adding padding ...")
-    hmap = np.pad(hmap, 1, mode="constant", constant_values=PAD_CONSTANT)
-
-    # ... just iterate and check (von Neumann) neighbours
-    low_points = []  # (y, x) coordinate tuples
-
-    it = np.nditer(hmap, flags=['multi_index'])
-    for h in it:
-        if h == PAD_CONSTANT:
-            # Don't need to check the padding
-            continue
-
-        y, x = it.multi_index
-        if min(hmap[y, x+1], hmap[y, x-1], hmap[y+1, x], hmap[y-1, x]) > h:
-            low_points.append((y-1, x-1))  # -1 to counteract padding
+    low_points = np.argwhere(is_low)
+    risk = int(np.sum(hmap[is_low], dtype=np.int64) + len(low_points))
 
     print(f"  Found {len(low_points)} low points.")
-    return low_points
+    return low_points, risk
 
 def solve_part1(*, input_mode: str) -> int:
     """Computes the solution for part 1 by simply looking at the neighbours"""
@@ -54,7 +55,7 @@ def solve_part1(*, input_mode: str) -> int:
     hmap = np.array([[int(v) for v in l] for l in data])
     print(f"Have height map of shape {hmap.shape}.")
 
-    low_points = find_low_points(hmap)
+    low_points, risk = find_low_points(hmap)
 
     if input_mode == "test":
         print(
@@ -62,78 +63,347 @@ def solve_part1(*, input_mode: str) -> int:
         )
         print(f"\nHeight map:\n{hmap}")
 
-    return sum(hmap[y,x] + 1 for y, x in low_points)
+    return risk
 
 
 # -- Part 2 -------------------------------------------------------------------
 
-def mark_cc(mask, clusters, *, midx: tuple, cluster_id: int):
-    """Recursively marks all neighbours of the given ``midx`` position that are
-    part of the same component with the given cluster ID
+def union_find(num_nodes: int, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Determines the connected components of a graph given by its edges
+    (a, b), returning for each node the smallest node of its component.
+
+    Iteratively hooks the root of the larger node onto the root of the smaller
+    one for all edges at once, then compresses all paths by pointer jumping.
+    As parents are always smaller than their children, this cannot produce
+    cycles and terminates once all edges lie within a component.
+    """
+    parent = np.arange(num_nodes)
+
+    while True:
+        root_a, root_b = parent[a], parent[b]
+        differ = root_a != root_b
+        if not np.any(differ):
+            return parent
+
+        np.minimum.at(
+            parent,
+            np.maximum(root_a[differ], root_b[differ]),
+            np.minimum(root_a[differ], root_b[differ]),
+        )
+
+        # Compress until every node points directly to its root
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+
+def label_basins(mask: np.ndarray) -> Tuple[np.ndarray, int]:
+    """Labels the connected components of a boolean mask (von Neumann
+    neighbourhood) without recursion.
+
+    Horizontal runs of ``True`` values within each row are labelled first, all
+    at once. Runs in adjacent rows that touch each other are then merged using
+    a union-find over the runs, which are far fewer than the cells.
+
+    Returns (``int32`` label array with 0 outside the mask, number of labels)
+    """
+    # Give each horizontal run its own ID, starting from 1
+    starts = mask.copy()
+    starts[:, 1:] &= ~mask[:, :-1]
+    run_ids = np.cumsum(starts, axis=None).reshape(mask.shape)
+    run_ids[~mask] = 0
+    num_runs = int(run_ids.max(initial=0))
+
+    # Vertically adjacent cells connect their runs; consecutive cells along a
+    # row mostly connect the same pair of runs, which need not be repeated
+    touching = mask[:-1, :] & mask[1:, :]
+    upper, lower = run_ids[:-1, :][touching], run_ids[1:, :][touching]
+    is_new = np.ones(len(upper), dtype=bool)
+    is_new[1:] = (upper[1:] != upper[:-1]) | (lower[1:] != lower[:-1])
+    roots = union_find(num_runs + 1, upper[is_new], lower[is_new])
+
+    # Relabel with consecutive basin IDs; ID 0 remains outside the mask
+    is_root = roots == np.arange(num_runs + 1)
+    basin_ids = (np.cumsum(is_root) - 1)[roots].astype(np.int32)
+    return basin_ids[run_ids], int(np.sum(is_root)) - 1
+
+class BasinIndex:
+    """Holds the basin labels of a height map together with per-basin
+    properties, answering which basin a point belongs to, how large it is,
+    where its low point is, and what its bounding box is.
+
+    Per-basin properties are stored in arrays indexed by the basin label, with
+    label 0 denoting points that are not part of any basin. Point queries are
+    thus O(1) lookups and batch queries are vectorized.
+    """
+
+    def __init__(
+        self, *, labels: np.ndarray, sizes: np.ndarray,
+        low_points: np.ndarray, bboxes: np.ndarray,
+    ):
+        """Sets up the index from precomputed arrays; to build it from a height
+        map, use :py:meth:`from_height_map`.
+
+        Args:
+            labels (np.ndarray): The basin label of each cell (0: no basin)
+            sizes (np.ndarray): Size of each basin, shape (# labels,)
+            low_points (np.ndarray): (y, x) coordinates of the lowest point
+                of each basin, shape (# labels, 2)
+            bboxes (np.ndarray): Inclusive bounding box of each basin as
+                (y_min, x_min, y_max, x_max), shape (# labels, 4)
+        """
+        self.labels = labels
+        self.sizes = sizes
+        self.low_points = low_points
+        self.bboxes = bboxes
+
+    @classmethod
+    def from_height_map(cls, hmap: np.ndarray) -> "BasinIndex":
+        """Labels the basins of a height map and computes their properties"""
+        labels, num_basins = label_basins(hmap < 9)
+        num_labels = num_basins + 1
+
+        flat_labels = labels.ravel()
+        in_basin = np.flatnonzero(flat_labels)
+        ys, xs = np.unravel_index(in_basin, labels.shape)
+
+        sizes = np.bincount(flat_labels, minlength=num_labels)
+        sizes[0] = 0
+
+        # Lowest point of each basin: sort by label, then height, and pick the
+        # first cell of each label (ties resolved by position)
+        order = np.lexsort(
+            (in_basin, hmap.ravel()[in_basin], flat_labels[in_basin])
+        )
+        _, first = np.unique(flat_labels[in_basin][order], return_index=True)
+        low_points = np.full((num_labels, 2), -1, dtype=np.int64)
+        low_points[1:] = np.stack((ys, xs), axis=1)[order[first]]
+
+        bboxes = np.full((num_labels, 4), -1, dtype=np.int64)
+        bboxes[1:, :2] = np.iinfo(np.int64).max
+        for col, (coords, func) in enumerate((
+            (ys, np.minimum), (xs, np.minimum),
+            (ys, np.maximum), (xs, np.maximum),
+        )):
+            func.at(bboxes[:, col], flat_labels[in_basin], coords)
+
+        return cls(
+            labels=labels, sizes=sizes, low_points=low_points, bboxes=bboxes
+        )
+
+    @property
+    def num_basins(self) -> int:
+        """The number of basins"""
+        return len(self.sizes) - 1
+
+    def query(self, y: int, x: int) -> dict:
+        """Returns the label, size, low point, and bounding box of the basin
+        the point (y, x) belongs to. Points that are not part of a basin have
+        label and size 0 and no low point and bounding box.
+        """
+        label = int(self.labels[y, x])
+        if not label:
+            return dict(label=0, size=0, low_point=None, bbox=None)
+
+        return dict(
+            label=label,
+            size=int(self.sizes[label]),
+            low_point=tuple(self.low_points[label].tolist()),
+            bbox=tuple(self.bboxes[label].tolist()),
+        )
+
+    def query_many(self, points) -> dict:
+        """Answers queries for a batch of points
+
+        Args:
+            points: Array-like of shape (# points, 2) with (y, x) coordinates
+
+        Returns:
+            dict: Arrays of labels, sizes, low points, and bounding boxes; for
+                points outside of basins, low points and bounding boxes are -1
+        """
+        points = np.asarray(points).reshape(-1, 2)
+        labels = self.labels[points[:, 0], points[:, 1]]
+        return dict(
+            label=labels,
+            size=self.sizes[labels],
+            low_point=self.low_points[labels],
+            bbox=self.bboxes[labels],
+        )
+
+    def save(self, fpath: str) -> None:
+        """Stores the index to a (compressed) ``.npz`` file"""
+        np.savez_compressed(
+            fpath, labels=self.labels, sizes=self.sizes,
+            low_points=self.low_points, bboxes=self.bboxes,
+        )
+
+    @classmethod
+    def load(cls, fpath: str) -> "BasinIndex":
+        """Loads an index stored via :py:meth:`save`, without relabelling"""
+        with np.load(fpath) as f:
+            return cls(**{k: f[k] for k in f.files})
+
+
+# .. Out-of-core labelling ....................................................
+# For height maps larger than memory, the map is processed in bands of rows.
+# Each band is labelled independently; labels are then merged across the
+# seams between bands, which only requires the first and last row of labels
+# of each band to be kept.
+
+def open_height_map(fpath: str) -> np.ndarray:
+    """Memory-maps a height map file without reading it into memory.
+
+    Files ending in ``.npy`` are opened via ``np.load``; other files are
+    expected to be in puzzle input format, i.e. lines of equal length with one
+    digit per cell. For the latter, the returned ``uint8`` array holds the
+    *characters*; subtract ``ord("0")`` to get the heights.
+    """
+    if fpath.endswith(".npy"):
+        return np.load(fpath, mmap_mode="r")
+
+    with open(fpath, mode="rb") as f:
+        width = len(f.readline().rstrip(b"\r\n"))
+        line_len = f.tell()
+
+    raw = np.memmap(fpath, dtype=np.uint8, mode="r")
+    num_rows = (raw.size + line_len - width) // line_len
+    return np.lib.stride_tricks.as_strided(
+        raw, shape=(num_rows, width), strides=(line_len, 1), writeable=False
+    )
+
+def _load_band(fpath: str, start: int, stop: int) -> np.ndarray:
+    """Loads the heights of the rows [start, stop) of a height map file"""
+    hmap = open_height_map(fpath)
+    band = np.array(hmap[start:stop], dtype=np.uint8)
+    if not fpath.endswith(".npy"):
+        band -= ord("0")
+    return band
+
+def _label_band(fpath: str, start: int, stop: int) -> dict:
+    """Labels the basins and finds the low points within a band of rows.
+
+    To determine low points at the band boundaries, the adjacent rows of the
+    neighbouring bands are loaded as well.
+    """
+    num_rows = open_height_map(fpath).shape[0]
+    halo_start, halo_stop = max(start - 1, 0), min(stop + 1, num_rows)
+    hmap = _load_band(fpath, halo_start, halo_stop)
+
+    is_low = low_point_mask(hmap)[start - halo_start:stop - halo_start]
+    hmap = hmap[start - halo_start:stop - halo_start]
+
+    labels, num_basins = label_basins(hmap < 9)
+    low_points = np.argwhere(is_low)
+    low_points[:, 0] += start
+
+    return dict(
+        num_basins=num_basins,
+        sizes=np.bincount(labels.ravel(), minlength=num_basins + 1)[1:],
+        first_row=labels[0],
+        last_row=labels[-1],
+        low_points=low_points,
+        risk=int(np.sum(hmap[is_low], dtype=np.int64) + len(low_points)),
+    )
+
+def label_basins_tiled(
+    fpath: str, *, band_rows: int = 1024, processes: int = None
+) -> Tuple[np.ndarray, np.ndarray, int]:
+    """Determines basin sizes and low points of a height map file without
+    loading it into memory as a whole.
+
+    Bands of ``band_rows`` rows are labelled independently, optionally in
+    parallel worker processes. Band-local labels are made globally unique by
+    offsetting them; basins spanning several bands are merged by a union-find
+    over the labels of the rows adjacent to the seams between bands.
+
+    Args:
+        fpath (str): Path to the height map, see :py:func:`open_height_map`
+        band_rows (int, optional): Number of rows to process at once
+        processes (int, optional): If given, the number of worker processes
+            to label the bands with; otherwise, bands are labelled serially.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, int]: Sizes of all basins (in no
+            particular order), (y, x) coordinates of all low points, and the
+            sum of their risk levels
     """
-    # If it's a boundary or there already is an ID, there's nothing to do
-    if not mask[midx] or clusters[midx]:
-        return
-
-    # Otherwise: mark and recurse
-    clusters[midx] = cluster_id
-    y, x = midx
-    mark_cc(mask, clusters, midx=(y-1, x), cluster_id=cluster_id)
-    mark_cc(mask, clusters, midx=(y+1, x), cluster_id=cluster_id)
-    mark_cc(mask, clusters, midx=(y, x-1), cluster_id=cluster_id)
-    mark_cc(mask, clusters, midx=(y, x+1), cluster_id=cluster_id)
-
-def find_connected_components(mask: np.ndarray) -> list:
-    """Given a boolean mask, finds the connected components and returns a list
-    of sets, each set representing the coordinates of the connected positions
-    in the mask.
-
-    .. note::
-
-        This relies on the mask being padded with False values.
+    num_rows = open_height_map(fpath).shape[0]
+    starts = list(range(0, num_rows, band_rows))
+    stops = [min(start + band_rows, num_rows) for start in starts]
+    args = ([fpath] * len(starts), starts, stops)
+
+    if processes is None:
+        bands = list(map(_label_band, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            bands = list(pool.map(_label_band, *args))
+
+    # Make labels globally unique (keeping 0 as the non-basin label)
+    offsets = np.cumsum([0] + [band["num_basins"] for band in bands])
+    to_global = lambda labels, offset: np.where(labels, labels + offset, 0)
+
+    # Basins that touch across a seam are connected
+    upper, lower = [], []
+    for n, (above, below) in enumerate(zip(bands[:-1], bands[1:])):
+        touching = (above["last_row"] > 0) & (below["first_row"] > 0)
+        upper.append(to_global(above["last_row"], offsets[n])[touching])
+        lower.append(to_global(below["first_row"], offsets[n+1])[touching])
+
+    num_labels = int(offsets[-1])
+    roots = union_find(
+        num_labels + 1,
+        np.concatenate(upper or [[]]).astype(int),
+        np.concatenate(lower or [[]]).astype(int),
+    )
+
+    # Accumulate band-local sizes onto the merged basins
+    sizes = np.zeros(num_labels + 1, dtype=np.int64)
+    local_sizes = np.concatenate([[0]] + [band["sizes"] for band in bands])
+    np.add.at(sizes, roots, local_sizes)
+    sizes = sizes[1:][(roots == np.arange(num_labels + 1))[1:]]
+
+    low_points = np.concatenate(
+        [band["low_points"] for band in bands]
+    ).reshape(-1, 2)
+    risk = sum(band["risk"] for band in bands)
+
+    return sizes, low_points, risk
+
+def solve_part2(
+    *, input_mode: str, band_rows: int = None, processes: int = None
+) -> int:
+    """Computes the solution for part 2 using a 'watershed' method
+
+    If ``band_rows`` is given, the input file is processed out-of-core in
+    bands of this many rows, optionally using ``processes`` worker processes.
+    This is only available for the file input mode.
     """
-    clusters = np.zeros_like(mask, dtype=int)
-
-    # Recursively walk through the mask and associate positions with an ID
-    it = np.nditer(mask, flags=['multi_index'])
-    for start_id, val in enumerate(it):
-        if not val:
-            # Is a boundary, nothing to mark
-            continue
-        # else: is part of a basin
-        # Recursively mark neighbours with an (arbitrary) ID
-        mark_cc(mask, clusters, midx=it.multi_index, cluster_id=start_id)
-
-    print(f"Clusters:\n{clusters}")
-
-    # Gather clusters
-    cc = defaultdict(set)
-    it = np.nditer(clusters, flags=['multi_index'])
-    for cluster_id in it:
-        if not cluster_id:
-            continue
-        cc[int(cluster_id)].add(tuple(it.multi_index))
-
-    return list(cc.values())
-
-def solve_part2(*, input_mode: str) -> int:
-    """Computes the solution for part 2 using a 'watershed' method"""
+    if band_rows is not None:
+        if input_mode != "file":
+            raise ValueError("Out-of-core labelling requires file input!")
+
+        sizes, low_points, _ = label_basins_tiled(
+            INPUT_FILE, band_rows=band_rows, processes=processes
+        )
+        print(f"Found {len(sizes)} basins and {len(low_points)} low points.")
+        largest = np.partition(np.append(sizes, [0, 0, 0]), -3)[-3:]
+        return int(np.prod(largest, dtype=np.int64))
+
     data = load_input(input_mode, **INPUT_KWARGS)
     hmap = np.array([[int(v) for v in l] for l in data])
     print(f"Have height map of shape {hmap.shape}.")
 
-    # Again add a padding to avoid boundary problems
-    hmap = np.pad(hmap, 1, mode="constant", constant_values=PAD_CONSTANT)
-
-    # Mark basins
-    hmap_mask = hmap < 9
+    # Mark basins and find connected components
+    labels, num_basins = label_basins(hmap < 9)
     if input_mode == "test":
-        print(f"Height map (padded):\n{hmap}\n")
-        print(f"Basins:\n{hmap_mask.astype(int)}\n")
+        print(f"Height map:\n{hmap}\n")
+        print(f"Basins:\n{labels}\n")
+    print(f"Found {num_basins} basins.")
 
-    # Find connected components by walking
-    cc = find_connected_components(hmap_mask)
-    print(f"Found {len(cc)} connected components.")
-    cc_sizes_desc = sorted([len(c) for c in cc])[::-1]  # --> descending size
+    # Only need the three largest basins, no need to sort all of them
+    sizes = np.bincount(labels.ravel(), minlength=4)[1:]
+    largest = np.partition(sizes, -3)[-3:]
 
-    return cc_sizes_desc[0] * cc_sizes_desc[1] * cc_sizes_desc[2]
+    return int(np.prod(largest, dtype=np.int64))
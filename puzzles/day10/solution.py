@@ -2,6 +2,8 @@
 
 For puzzle text, see: https://adventofcode.com/2021/day/10
 """
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
 
 from ..tools import relative_to_file, load_input
 
@@ -31,71 +33,70 @@ BRACE_PAIRS = {
 BRACE_PAIRS_INV = {v: k for k, v in BRACE_PAIRS.items()}
 
 
-def check_syntax(data: list, *, incl_completions: bool = False) -> dict:
-    """Performs the syntax check and categorises lines into groups"""
-    is_opening = lambda c: c in BRACE_PAIRS.keys()
-    is_closing = lambda c: c in BRACE_PAIRS.values()
+# Character classes, looked up once per character in the inner loop
+OPENING, CLOSING, INVALID = 0, 1, 2
+CHAR_CLASSES = {
+    **{c: OPENING for c in BRACE_PAIRS},
+    **{c: CLOSING for c in BRACE_PAIRS_INV},
+}
+
+
+def scan_line(line: str) -> Tuple[int, list]:
+    """Scans a single line and returns the column of the first corrupting
+    character (-1 if there is none) and the stack of open chunks at that point
+    or at the end of the line. Invalid characters are ignored.
+    """
+    chunks = []
+    classes = CHAR_CLASSES
+
+    for n, char in enumerate(line):
+        char_class = classes.get(char, INVALID)
+
+        if char_class == OPENING:
+            # Put it on the stack
+            chunks.append(char)
+
+        elif char_class == CLOSING:
+            if chunks and chunks[-1] == BRACE_PAIRS_INV[char]:
+                # Matches its counterpart, can pop it from the stack
+                chunks.pop()
+
+            else:
+                return n, chunks
 
+    return -1, chunks
+
+
+def _check_chunk(
+    first_line_no: int, lines: List[str], incl_completions: bool
+) -> dict:
+    """Performs the syntax check on a chunk of lines, numbering the lines
+    starting from ``first_line_no``
+    """
     invalid_chars = []
     incomplete_lines = []
     valid_lines = []
     corrupted_lines = []
     completions = {}
 
-    for line_no, line in enumerate(data):
-        chunks = []
+    for line_no, line in enumerate(lines, start=first_line_no):
+        col, chunks = scan_line(line)
 
-        for n, char in enumerate(line):
-            if is_opening(char):
-                # Put it on the stack
-                chunks.append(char)
+        if col >= 0:
+            # Invalid closing character. Keep track of it.
+            invalid_chars.append(line[col])
+            corrupted_lines.append(line_no)
 
-            elif is_closing(char):
-                if chunks[-1] == BRACE_PAIRS_INV[char]:
-                    # Matches its counterpart, can pop it from the stack
-                    chunks.pop()
-
-                else:
-                    # Invalid closing character. Keep track of it.
-                    print(
-                        f"Syntax error in line {line_no:3d}, col {n:3d}:  "
-                        f"Expected '{BRACE_PAIRS[chunks[-1]]}', got '{char}'"
-                    )
-                    invalid_chars.append(char)
-                    corrupted_lines.append(line_no)
-                    break
-
-            else:
-                print(
-                    f"Syntax error in line {line_no:3d}, col {n:3d}:  "
-                    f"Invalid character '{char}'!"
-                )
+        elif not chunks:
+            valid_lines.append(line_no)
 
         else:
-            # End of line reached, check if it was complete
-            if not len(chunks):
-                valid_lines.append(line_no)
-                continue
-
-            # else: was incomplete
-            print(
-                f"Syntax error in line {line_no:3d}, col {n:3d}:  "
-                f"Incomplete line."
-            )
             incomplete_lines.append(line_no)
             if incl_completions:
                 completions[line_no] = "".join(
                     BRACE_PAIRS[c] for c in chunks[::-1]
                 )
 
-    print(
-        f"\nScanned syntax of {len(data)} lines:\n"
-        f"  Valid lines:        {valid_lines}\n"
-        f"  Incomplete lines:   {incomplete_lines}\n"
-        f"  Corrupted lines:    {corrupted_lines}\n"
-        f"  Invalid characters: {invalid_chars}\n"
-    )
-
     return dict(
         valid=valid_lines,
         incomplete=incomplete_lines,
@@ -105,12 +106,64 @@ def check_syntax(data: list, *, incl_completions: bool = False) -> dict:
     )
 
 
+def check_syntax(
+    data: list, *, incl_completions: bool = False,
+    processes: int = None, chunk_size: int = 10000,
+) -> dict:
+    """Performs the syntax check and categorises lines into groups
+
+    Args:
+        data (list): The lines to check
+        incl_completions (bool, optional): Whether to determine the strings
+            that would complete the incomplete lines
+        processes (int, optional): If given, distributes chunks of lines to
+            this many worker processes; otherwise checks all lines in this
+            process.
+        chunk_size (int, optional): Number of lines per chunk
+    """
+    if processes is None:
+        results = _check_chunk(0, data, incl_completions)
+
+    else:
+        starts = range(0, len(data), chunk_size)
+        chunks = [data[start:start + chunk_size] for start in starts]
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            chunk_results = list(pool.map(
+                _check_chunk, starts, chunks,
+                [incl_completions] * len(chunks),
+                chunksize=max(1, len(chunks) // (4 * processes)),
+            ))
+
+        # Chunks are in order, such that concatenation preserves line order
+        results = dict(
+            valid=[], incomplete=[], corrupted=[], invalid_chars=[],
+            completions={},
+        )
+        for chunk_result in chunk_results:
+            for key, value in chunk_result.items():
+                if key == "completions":
+                    results[key].update(value)
+                else:
+                    results[key] += value
+
+    _fmt = lambda l: f"{len(l):6d}  {l if len(l) < 30 else ''}"
+    print(
+        f"\nScanned syntax of {len(data)} lines:\n"
+        f"  Valid lines:        {_fmt(results['valid'])}\n"
+        f"  Incomplete lines:   {_fmt(results['incomplete'])}\n"
+        f"  Corrupted lines:    {_fmt(results['corrupted'])}\n"
+        f"  Invalid characters: {_fmt(results['invalid_chars'])}\n"
+    )
+
+    return results
+
+
 # -- Part 1 -------------------------------------------------------------------
 
-def solve_part1(*, input_mode: str) -> int:
+def solve_part1(*, input_mode: str, processes: int = None) -> int:
     """Computes the solution for part 1"""
     data = load_input(input_mode, **INPUT_KWARGS)
-    results = check_syntax(data)
+    results = check_syntax(data, processes=processes)
 
     SCORES = {
         ")": 3,
@@ -123,24 +176,130 @@ def solve_part1(*, input_mode: str) -> int:
 
 # -- Part 2 -------------------------------------------------------------------
 
-def solve_part2(*, input_mode: str) -> int:
+COMPLETION_SCORES = {
+    ")": 1,
+    "]": 2,
+    "}": 3,
+    ">": 4,
+}
+
+# Lookup tables by byte value, for scanning byte streams
+_BYTE_CLASSES = [CHAR_CLASSES.get(chr(b), INVALID) for b in range(256)]
+_BYTE_PARTNERS = [
+    ord(BRACE_PAIRS_INV.get(chr(b), "\0")) for b in range(256)
+]
+_BYTE_SCORES = [
+    COMPLETION_SCORES.get(BRACE_PAIRS.get(chr(b)), 0) for b in range(256)
+]
+
+
+class BracketScanner:
+    """Resumable syntax checker for a single line that arrives in chunks,
+    e.g. from a byte stream, such that the line never needs to be held in
+    memory as a whole.
+
+    The stack of open chunks is kept between calls to :py:meth:`feed` as a
+    ``bytearray``, i.e. one byte per open chunk. As in :py:func:`scan_line`,
+    invalid characters are ignored.
+    """
+
+    def __init__(self):
+        self.stack = bytearray()
+        self.offset = 0              # number of characters fed so far
+        self.corrupted_at = None     # offset of the first corrupting char
+        self.invalid_char = None
+
+    @property
+    def is_corrupted(self) -> bool:
+        """Whether a corrupting character was encountered"""
+        return self.corrupted_at is not None
+
+    def feed(self, chunk) -> int:
+        """Scans the next chunk of the line (``bytes`` or ``str``).
+
+        Returns the offset of the first corrupting character if it is found
+        within this chunk, None otherwise. Once the line is corrupted, further
+        chunks are only counted, not scanned.
+        """
+        if isinstance(chunk, str):
+            chunk = chunk.encode("ascii")
+
+        start = self.offset
+        self.offset += len(chunk)
+        if self.is_corrupted:
+            return None
+
+        stack = self.stack
+        classes, partners = _BYTE_CLASSES, _BYTE_PARTNERS
+
+        for n, b in enumerate(chunk):
+            char_class = classes[b]
+
+            if char_class == OPENING:
+                stack.append(b)
+
+            elif char_class == CLOSING:
+                if stack and stack[-1] == partners[b]:
+                    stack.pop()
+
+                else:
+                    self.corrupted_at = start + n
+                    self.invalid_char = chr(b)
+                    return self.corrupted_at
+
+        return None
+
+    def iter_completion(self):
+        """Lazily yields the characters that would complete the line"""
+        for b in reversed(self.stack):
+            yield BRACE_PAIRS[chr(b)]
+
+    def completion_score(self) -> int:
+        """Computes the completion score directly from the stack, without
+        building the completion string
+        """
+        score = 0
+        for b in reversed(self.stack):
+            score = score * 5 + _BYTE_SCORES[b]
+        return score
+
+    def finish(self, *, incl_completion: bool = True) -> dict:
+        """Evaluates the line after the last chunk was fed.
+
+        Returns a dict with the ``status`` (``valid``, ``incomplete``, or
+        ``corrupted``) and, depending on it, either the ``offset`` and
+        ``invalid_char`` of the corruption or the completion ``score`` and,
+        if ``incl_completion`` is set, the ``completion`` string.
+        """
+        if self.is_corrupted:
+            return dict(
+                status="corrupted",
+                offset=self.corrupted_at,
+                invalid_char=self.invalid_char,
+            )
+
+        if not self.stack:
+            return dict(status="valid")
+
+        results = dict(status="incomplete", score=self.completion_score())
+        if incl_completion:
+            results["completion"] = "".join(self.iter_completion())
+        return results
+
+
+def solve_part2(*, input_mode: str, processes: int = None) -> int:
     """Computes the solution for part 2"""
-    SCORES = {
-        ")": 1,
-        "]": 2,
-        "}": 3,
-        ">": 4,
-    }
     def compute_line_score(compl: str):
         s = 0
         for c in compl:
-            s = s*5 + SCORES[c]
+            s = s*5 + COMPLETION_SCORES[c]
         return s
 
     data = load_input(input_mode, **INPUT_KWARGS)
-    results = check_syntax(data, incl_completions=True)
+    results = check_syntax(
+        data, incl_completions=True, processes=processes
+    )
     scores = [
         compute_line_score(compl) for compl in results["completions"].values()
     ]
     return sorted(scores)[len(scores)//2]
-    
@@ -2,6 +2,9 @@
 
 For puzzle text, see: https://adventofcode.com/2021/day/11
 """
+import hashlib
+from typing import Tuple
+
 import numpy as np
 
 from ..tools import relative_to_file, load_input
@@ -24,71 +27,234 @@ TEST_INPUT = """
 INPUT_KWARGS = dict(day=DAY, fpath=INPUT_FILE, test_input=TEST_INPUT)
 
 
-# -- Part 1 -------------------------------------------------------------------
+# Offsets of the Moore neighbourhood
+MOORE_OFFSETS = [
+    (dy, dx) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if (dy, dx) != (0, 0)
+]
+
+
+def parse_energy_map(data: list) -> np.ndarray:
+    """Parses the input into a ``uint8`` energy map"""
+    return np.array([[int(v) for v in line] for line in data], dtype=np.uint8)
 
-def evaluate_flashes(energy: np.ndarray, has_flashed: np.ndarray) -> int:
-    """Evaluates flashes of the Dumbo Octopusses and returns the number of new
-    flashes that occured as a result.
+def count_flashing_neighbours(flashing: np.ndarray) -> np.ndarray:
+    """Counts the flashing Moore neighbours of each cell by summing shifted
+    slices of the (boolean) flash map. Operates on the last two axes, such
+    that it can be applied to stacks of maps as well.
     """
-    # Mark as flashed and set energy to zero for those that have flashed
-    new_flashes = energy > 9
-    energy[new_flashes] = 0
-
-    # Keep track of overall flashes
-    has_flashed[new_flashes] = True
-
-    # Propagate energy to Moore neighbours
-    delta_energy = np.zeros_like(energy)
-    y_max, x_max = energy.shape
-
-    it = np.nditer(new_flashes, flags=['multi_index'])
-    for flashed in it:
-        if not flashed:
-            continue
-
-        # Construct a 3x3 subarray selector and mark the whole neighbourhood
-        # (including the source of the flash) as being in flash vicinity,
-        # incrementing the energy change. Then discount the central point's
-        # energy change, because that one is not affected
-        y, x = it.multi_index
-        sel = (
-            slice(max(0, y-1), min(y+2, y_max)),
-            slice(max(0, x-1), min(x+2, x_max)),
+    counts = np.zeros(flashing.shape, dtype=np.uint8)
+
+    for dy, dx in MOORE_OFFSETS:
+        # The cells receiving from the neighbours at offset (dy, dx) and the
+        # neighbours themselves
+        dst = (
+            ...,
+            slice(max(0, -dy), flashing.shape[-2] - max(0, dy)),
+            slice(max(0, -dx), flashing.shape[-1] - max(0, dx)),
+        )
+        src = (
+            ...,
+            slice(max(0, dy), flashing.shape[-2] - max(0, -dy)),
+            slice(max(0, dx), flashing.shape[-1] - max(0, -dx)),
         )
-        delta_energy[sel] += 1
-        delta_energy[y, x] -= 1
+        counts[dst] += flashing[src]
+
+    return counts
+
+def simulate_step(energy: np.ndarray) -> np.ndarray:
+    """Simulates a single step in-place on the energy map and returns the
+    (boolean) map of octopusses that flashed in this step.
+
+    The cascade is evaluated in rounds: in each round, all octopusses that
+    newly exceed an energy level of 9 flash and increment their neighbours,
+    until no new flashes occur.
+
+    .. note::
+
+        Each octopus flashes at most once per step, such that its energy can
+        exceed 9 by at most the number of its neighbours; ``uint8`` suffices.
+    """
+    energy += 1
+    has_flashed = np.zeros(energy.shape, dtype=bool)
+    new_flashes = energy > 9
+
+    while np.any(new_flashes):
+        has_flashed |= new_flashes
+        energy += count_flashing_neighbours(new_flashes)
+        new_flashes = (energy > 9) & ~has_flashed
+
+    energy[has_flashed] = 0
+    return has_flashed
+
+def simulate_colonies(
+    energies: np.ndarray, *, num_steps: int = 100, max_steps: int = 10000
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Simulates many independent colonies of equal shape in lock-step.
+
+    Colonies are stacked along the first axis and advanced together using the
+    same vectorized cascade as for a single colony. A colony is dropped from
+    the active set once it has both completed ``num_steps`` steps and reached
+    its first synchronized step, such that later steps only touch colonies
+    that are still running.
+
+    Args:
+        energies (np.ndarray): The energy maps, shape (# colonies, H, W).
+            Not modified; the simulation works on a copy.
+        num_steps (int, optional): The number of steps to count flashes in
+        max_steps (int, optional): The number of steps after which to give
+            up waiting for synchronization
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: the number of flashes within the first
+            ``num_steps`` steps and the first synchronized step of each
+            colony (-1 if there was none within ``max_steps``)
+    """
+    num_colonies = len(energies)
+    num_flashes = np.zeros(num_colonies, dtype=np.int64)
+    sync_step = np.full(num_colonies, -1, dtype=np.int64)
+
+    active = np.arange(num_colonies)  # original indices of active colonies
+    energy = np.array(energies, dtype=np.uint8)
+
+    for n in range(1, max(num_steps, max_steps) + 1):
+        has_flashed = simulate_step(energy)
+
+        if n <= num_steps:
+            num_flashes[active] += np.sum(has_flashed, axis=(1, 2))
+
+        synced = np.all(has_flashed, axis=(1, 2)) & (sync_step[active] < 0)
+        sync_step[active[synced]] = n
+
+        # Drop colonies that are done; this compacts the working array
+        if n >= num_steps:
+            done = (sync_step[active] >= 0) | (n >= max_steps)
+            if np.any(done):
+                active, energy = active[~done], energy[~done]
+
+        if not len(active):
+            break
+
+    return num_flashes, sync_step
 
-    # print(f"\nnew_flashes:\n{new_flashes.astype(int)}")
-    # print(f"\ndelta_energy:\n{delta_energy}")
-    # Can now increment those areas that are in vicinity but have not flashed.
-    # Flash evaluation will occur in next call of this function
-    energy += delta_energy
 
-    return np.sum(new_flashes)
+class FlashTrajectory:
+    """Simulates a colony until its state repeats, which allows to
+    extrapolate flash counts and synchronized steps to arbitrary horizons.
+
+    As there are finitely many states and the dynamics are deterministic, the
+    trajectory eventually enters a cycle. States are identified by a hash of
+    their ``uint8`` bytes; once a state is seen again, the cycle start and
+    length are known and no further simulation is needed.
+    """
+
+    def __init__(self, energy: np.ndarray, *, max_steps: int = 1000000):
+        """Simulates the trajectory starting from the given energy map
+
+        Args:
+            energy (np.ndarray): The initial energy map (not modified)
+            max_steps (int, optional): The number of steps after which to stop
+                looking for a cycle
+        """
+        energy = np.array(energy, dtype=np.uint8)
+
+        seen = {self._hash(energy): 0}  # state hash -> step
+        self.cum_flashes = [0]          # flashes within steps 1 .. n
+        self.synchronized = [False]     # whether step n was synchronized
+        self.cycle_start = None
+        self.cycle_length = None
+
+        for n in range(1, max_steps + 1):
+            has_flashed = simulate_step(energy)
+            self.cum_flashes.append(
+                self.cum_flashes[-1] + int(np.sum(has_flashed))
+            )
+            self.synchronized.append(bool(np.all(has_flashed)))
+
+            key = self._hash(energy)
+            if key in seen:
+                self.cycle_start = seen[key]
+                self.cycle_length = n - seen[key]
+                break
+            seen[key] = n
+
+    @staticmethod
+    def _hash(energy: np.ndarray) -> bytes:
+        """Computes a compact hash of a state"""
+        return hashlib.blake2b(energy.tobytes(), digest_size=16).digest()
+
+    @property
+    def num_simulated(self) -> int:
+        """The number of simulated steps"""
+        return len(self.cum_flashes) - 1
+
+    def _check_horizon(self, n: int):
+        """Raises if step n can neither be looked up nor extrapolated"""
+        if n > self.num_simulated and self.cycle_start is None:
+            raise ValueError(
+                f"Cannot extrapolate to step {n}: no cycle was found within "
+                f"the {self.num_simulated} simulated steps!"
+            )
+
+    def flashes_after(self, n: int) -> int:
+        """Returns the total number of flashes within the first n steps"""
+        self._check_horizon(n)
+        if n <= self.num_simulated:
+            return self.cum_flashes[n]
+
+        # Full cycles plus the remainder of a cycle
+        mu, lam = self.cycle_start, self.cycle_length
+        num_cycles, rest = divmod(n - mu, lam)
+        per_cycle = self.cum_flashes[mu + lam] - self.cum_flashes[mu]
+        return self.cum_flashes[mu + rest] + num_cycles * per_cycle
+
+    def is_synchronized(self, n: int) -> bool:
+        """Whether all octopusses flash in step n"""
+        self._check_horizon(n)
+        if n <= self.num_simulated:
+            return self.synchronized[n]
+
+        mu, lam = self.cycle_start, self.cycle_length
+        return self.synchronized[mu + (n - mu - 1) % lam + 1]
+
+    def first_synchronized_step(self) -> int:
+        """The first synchronized step, or -1 if there never is one"""
+        try:
+            return self.synchronized.index(True)
+
+        except ValueError:
+            if self.cycle_start is None:
+                raise ValueError(
+                    "No synchronized step within the simulated steps and no "
+                    "cycle found to rule out later ones!"
+                )
+            return -1
+
+    def num_synchronized(self, n: int) -> int:
+        """Returns the number of synchronized steps within the first n steps"""
+        self._check_horizon(n)
+        if n <= self.num_simulated:
+            return sum(self.synchronized[:n + 1])
+
+        mu, lam = self.cycle_start, self.cycle_length
+        num_cycles, rest = divmod(n - mu, lam)
+        per_cycle = sum(self.synchronized[mu + 1:mu + lam + 1])
+        return sum(self.synchronized[:mu + rest + 1]) + num_cycles * per_cycle
+
+# -- Part 1 -------------------------------------------------------------------
 
 def solve_part1(*, input_mode: str) -> int:
     """Computes the solution for part 1"""
     data = load_input(input_mode, **INPUT_KWARGS)
-    energy = np.array([[int(v) for v in line] for line in data])
-    has_flashed = np.zeros_like(energy, dtype=bool)
+    energy = parse_energy_map(data)
     print(
         f"Have Dumbo Octopus energy map of shape {energy.shape}:\n{energy}\n"
     )
 
     num_flashes = 0
-    num_new_flashes = None
-    num_steps = 100 #if input_mode != "test" else 3
+    num_steps = 100
 
     for n in range(1, num_steps + 1):
-        energy += 1
-        num_new_flashes = None
-        has_flashed.fill(False)
-
-        while num_new_flashes != 0:
-            num_new_flashes = evaluate_flashes(energy, has_flashed)
-            num_flashes += num_new_flashes
-
-        energy[has_flashed] = 0
+        num_flashes += int(np.sum(simulate_step(energy)))
         print(
             f"After step {n:3d}:  {num_flashes:3d} flashes so far\n{energy}\n"
         )
@@ -101,30 +267,21 @@ def solve_part1(*, input_mode: str) -> int:
 def solve_part2(*, input_mode: str) -> int:
     """Computes the solution for part 2"""
     data = load_input(input_mode, **INPUT_KWARGS)
-    energy = np.array([[int(v) for v in line] for line in data])
-    has_flashed = np.zeros_like(energy, dtype=bool)
+    energy = parse_energy_map(data)
     print(
         f"Have Dumbo Octopus energy map of shape {energy.shape}:\n{energy}\n"
     )
 
     num_flashes = 0
-    num_new_flashes = None
+    has_flashed = np.zeros_like(energy, dtype=bool)
     n = 0
 
     while not np.all(has_flashed):
         n += 1
-        energy += 1
-        num_new_flashes = None
-        has_flashed.fill(False)
-
-        while num_new_flashes != 0:
-            num_new_flashes = evaluate_flashes(energy, has_flashed)
-            num_flashes += num_new_flashes
-
-        energy[has_flashed] = 0
+        has_flashed = simulate_step(energy)
+        num_flashes += int(np.sum(has_flashed))
         print(
             f"After step {n:3d}:  {num_flashes:3d} flashes so far\n{energy}\n"
         )
 
     return n
-    
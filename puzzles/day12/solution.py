@@ -2,8 +2,13 @@
 
 For puzzle text, see: https://adventofcode.com/2021/day/12
 """
-import copy
+import functools
+import itertools
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, NamedTuple, Tuple
+
+import numpy as np
 
 from ..tools import relative_to_file, load_input
 
@@ -75,50 +80,259 @@ def construct_network(links: list) -> dict:
 
     return network
 
-def walk_network(
-    nw: dict, *, position: str, visited: list, paths: set,
-    start: str = "start", end: str = "end",
-    small_cave_dual_visit: bool = False,
-) -> None:
-    """"""
-    # Can we move to this position?
-    if is_small_cave(position):
-        if not small_cave_dual_visit and position in visited:
-            # Cannot continue
-            return
-
-        elif small_cave_dual_visit:
-            if visited and position == start:
-                # May not go back to the start
-                return
-
-            # Was the dual visit already done?
-            elif position in visited:
-                # Can continue, but no further dual visit is allowed
-                small_cave_dual_visit = False
-
-        # else: may move to this position
-
-    # Keep track of where we are now
-    visited.append(position)
-
-    # Reached destination?
-    if position == end:
-        paths.add(tuple(visited))
-        return
-
-    # Branch into all possible directions
-    for target in nw[position]:
-        walk_network(
-            nw,
-            position=target,
-            visited=copy.copy(visited),
-            paths=paths,
-            start=start,
-            end=end,
-            small_cave_dual_visit=small_cave_dual_visit
-        )
+class CaveNetwork(NamedTuple):
+    """A cave network compiled to integer node IDs. The adjacency is stored
+    in compressed sparse row (CSR) format: the neighbours of node ``i`` are
+    ``indices[indptr[i]:indptr[i+1]]``.
+    """
+    names: List[str]
+    indptr: np.ndarray
+    indices: np.ndarray
+    is_small: np.ndarray
+    start: int
+    end: int
+
+    def adjacency_lists(self) -> List[List[int]]:
+        """Returns the neighbours of each node as lists, which are faster to
+        iterate over in pure Python than array slices
+        """
+        indices = self.indices.tolist()
+        bounds = self.indptr.tolist()
+        return [indices[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+def compile_network(
+    links: list, *, start: str = "start", end: str = "end"
+) -> CaveNetwork:
+    """Compiles the network into integer adjacency arrays"""
+    nw = construct_network(links)
+    names = sorted(nw)
+    ids = {name: i for i, name in enumerate(names)}
+
+    neighbours = [sorted(ids[n] for n in nw[name]) for name in names]
+    indptr = np.cumsum([0] + [len(nbs) for nbs in neighbours])
+    indices = np.array(
+        [n for nbs in neighbours for n in nbs], dtype=np.int32
+    )
+    is_small = np.array([is_small_cave(name) for name in names], dtype=bool)
+
+    return CaveNetwork(
+        names=names, indptr=indptr, indices=indices, is_small=is_small,
+        start=ids[start], end=ids[end],
+    )
+
+def count_paths(
+    links: list, *, start: str = "start", end: str = "end", revisits: int = 0
+) -> int:
+    """Counts the paths through the network without enumerating them.
+
+    Small caves visited so far are represented by a bitmask. The number of
+    paths from a node to the end only depends on the node, that mask, and the
+    number of remaining revisits, such that it can be memoized on those.
+
+    Args:
+        links (list): The links of the network
+        start (str, optional): Name of the start cave, which may not be
+            revisited
+        end (str, optional): Name of the end cave
+        revisits (int, optional): How often small caves that were already
+            visited may be entered again (in total). Part 1 corresponds to 0,
+            part 2 to 1.
+    """
+    network = compile_network(links, start=start, end=end)
+    neighbours = network.adjacency_lists()
+    start_id, end_id = network.start, network.end
+    small_bit = [
+        (1 << i) if small else 0 for i, small in enumerate(network.is_small)
+    ]
+
+    @functools.lru_cache(maxsize=None)
+    def count_from(node: int, visited: int, revisits_left: int) -> int:
+        if node == end_id:
+            return 1
+
+        visited |= small_bit[node]
+        num_paths = 0
+
+        for target in neighbours[node]:
+            if target == start_id:
+                continue
+
+            if not visited & small_bit[target]:
+                num_paths += count_from(target, visited, revisits_left)
+
+            elif revisits_left:
+                num_paths += count_from(target, visited, revisits_left - 1)
+
+        return num_paths
+
+    return count_from(start_id, 0, revisits)
+
+def walk_from(
+    network: CaveNetwork, prefix: List[int], *, revisits_left: int,
+    neighbours: List[List[int]] = None,
+) -> Iterator[List[int]]:
+    """Walks the network depth-first, yielding all paths that continue the
+    given path prefix to the end node.
+
+    Uses a single mutable path that is extended and backtracked, keeping one
+    neighbour iterator per path position instead of recursing. Memory is thus
+    proportional to the path length.
+
+    .. note::
+
+        The yielded path is the mutable path itself; copy it to keep it.
+
+    Args:
+        network (CaveNetwork): The compiled network
+        prefix (List[int]): The path so far, starting at the start node and
+            not yet containing the end node
+        revisits_left (int): How many revisits of small caves are left
+        neighbours (List[List[int]], optional): Adjacency lists of the
+            network, to avoid recomputing them for each call
+    """
+    if neighbours is None:
+        neighbours = network.adjacency_lists()
+    is_small = network.is_small.tolist()
+    start_id, end_id = network.start, network.end
+
+    visits = [0] * len(network.names)
+    for node in prefix:
+        visits[node] += 1
+
+    # The path and, per position, the neighbours still to explore and whether
+    # entering that position used up a revisit
+    num_fixed = len(prefix)
+    path = list(prefix)
+    to_explore = [iter(neighbours[path[-1]])]
+    used_revisit = [False]
+
+    while len(path) >= num_fixed:
+        target = next(to_explore[-1], None)
 
+        if target is None:
+            # Exhausted all directions: backtrack
+            node = path.pop()
+            to_explore.pop()
+            if used_revisit.pop():
+                revisits_left += 1
+            visits[node] -= 1
+            continue
+
+        if target == start_id:
+            continue
+
+        if target == end_id:
+            path.append(end_id)
+            yield path
+            path.pop()
+            continue
+
+        revisit = is_small[target] and visits[target] > 0
+        if revisit:
+            if not revisits_left:
+                continue
+            revisits_left -= 1
+
+        path.append(target)
+        to_explore.append(iter(neighbours[target]))
+        used_revisit.append(revisit)
+        visits[target] += 1
+
+def iter_paths(
+    links: list, *, start: str = "start", end: str = "end", revisits: int = 0,
+    limit: int = None,
+) -> Iterator[Tuple[str, ...]]:
+    """Lazily yields the paths through the network, one at a time, allowing
+    to stop iteration at any time.
+
+    Args:
+        links (list): The links of the network
+        start (str, optional): Name of the start cave, which may not be
+            revisited
+        end (str, optional): Name of the end cave
+        revisits (int, optional): How often small caves that were already
+            visited may be entered again (in total), see
+            :py:func:`count_paths`
+        limit (int, optional): If given, stops after this many paths
+    """
+    network = compile_network(links, start=start, end=end)
+    paths = walk_from(network, [network.start], revisits_left=revisits)
+
+    for path in itertools.islice(paths, limit):
+        yield tuple(network.names[n] for n in path)
+
+def _count_subtree(
+    network: CaveNetwork, prefix: List[int], revisits_left: int
+) -> int:
+    """Exhaustively counts the paths continuing a prefix (worker function)"""
+    paths = walk_from(network, prefix, revisits_left=revisits_left)
+    return sum(1 for _ in paths)
+
+def count_paths_parallel(
+    links: list, *, start: str = "start", end: str = "end", revisits: int = 0,
+    split_depth: int = 2, processes: int = None,
+) -> int:
+    """Counts paths by exhaustive search, split into independent subproblems
+    that are distributed to a process pool.
+
+    The search tree is expanded breadth-first for ``split_depth`` levels from
+    the start node. Each resulting path prefix spans an independent subtree,
+    which is searched by a worker process.
+
+    Args:
+        links (list): The links of the network
+        start (str, optional): Name of the start cave
+        end (str, optional): Name of the end cave
+        revisits (int, optional): How often small caves that were already
+            visited may be entered again (in total)
+        split_depth (int, optional): Number of levels to expand before
+            splitting into subproblems
+        processes (int, optional): Number of worker processes; defaults to
+            the number of CPUs
+    """
+    network = compile_network(links, start=start, end=end)
+    neighbours = network.adjacency_lists()
+    is_small = network.is_small.tolist()
+
+    # Expand prefixes level by level; paths that end within the first levels
+    # are counted right away
+    prefixes = [([network.start], revisits)]
+    num_paths = 0
+
+    for _ in range(split_depth):
+        expanded = []
+        for prefix, revisits_left in prefixes:
+            for target in neighbours[prefix[-1]]:
+                if target == network.start:
+                    continue
+
+                if target == network.end:
+                    num_paths += 1
+                    continue
+
+                if is_small[target] and target in prefix:
+                    if not revisits_left:
+                        continue
+                    expanded.append((prefix + [target], revisits_left - 1))
+
+                else:
+                    expanded.append((prefix + [target], revisits_left))
+
+        prefixes = expanded
+
+    print(
+        f"Split search into {len(prefixes)} subproblems at depth "
+        f"{split_depth} ..."
+    )
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        num_paths += sum(pool.map(
+            _count_subtree,
+            [network] * len(prefixes),
+            [prefix for prefix, _ in prefixes],
+            [revisits_left for _, revisits_left in prefixes],
+        ))
+
+    return num_paths
 
 # -- Part 1 -------------------------------------------------------------------
 
@@ -126,20 +340,12 @@ def solve_part1(*, input_mode: str) -> int:
     """Computes the solution for part 1"""
     data = load_input(input_mode, **INPUT_KWARGS)
     links = [line.split("-") for line in data]
-    print(f"Have network with {len(links)} links. Now walking ...")
-
-    paths = set()
-    walk_network(
-        construct_network(links),
-        position="start",
-        visited=[],
-        paths=paths,
-        start="start",
-        end="end",
-    )
-    print(f"Found {len(paths)} unique paths through the cave network.")
+    print(f"Have network with {len(links)} links. Now counting paths ...")
 
-    return len(paths)
+    num_paths = count_paths(links, start="start", end="end")
+    print(f"Found {num_paths} unique paths through the cave network.")
+
+    return num_paths
 
 
 # -- Part 2 -------------------------------------------------------------------
@@ -148,19 +354,9 @@ def solve_part2(*, input_mode: str) -> int:
     """Computes the solution for part 2"""
     data = load_input(input_mode, **INPUT_KWARGS)
     links = [line.split("-") for line in data]
-    print(f"Have network with {len(links)} links. Now walking ...")
-
-    paths = set()
-    walk_network(
-        construct_network(links),
-        position="start",
-        visited=[],
-        paths=paths,
-        start="start",
-        end="end",
-        small_cave_dual_visit=True,
-    )
-    print(f"Found {len(paths)} unique paths through the cave network.")
+    print(f"Have network with {len(links)} links. Now counting paths ...")
+
+    num_paths = count_paths(links, start="start", end="end", revisits=1)
+    print(f"Found {num_paths} unique paths through the cave network.")
 
-    return len(paths)
-    
+    return num_paths